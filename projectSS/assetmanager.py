@@ -0,0 +1,155 @@
+import os
+import time
+import pygame
+
+
+class AssetManager:
+    """
+    Lazy asset container used by Game. Assets are registered by name and only loaded from disk when first accessed.
+    Images are converted to the display's pixel format once, right after loading. Small images are packed into the
+    texture atlas and served from it instead. Assets can also be registered in named groups so that a game screen can
+    preload everything it needs before it is shown.
+
+    Sounds are sorted by file size. Short ones, the sound effects played all the time, stay loaded once loaded. Sounds
+    larger than TRANSIENT_SOUND_SIZE are long cues played once in a while, e.g. at a boss encounter: they are loaded
+    when needed and dropped again with release_transient() once they were played.
+
+    Accessed like a dictionary: game.assets["bg_game"].
+    """
+
+    TRANSIENT_SOUND_SIZE = 256 * 1024  # File size in bytes above which a sound is transient
+
+    def __init__(self, abs_dir):
+        self.abs_dir = abs_dir
+
+        self.sources = {}  # Asset name -> (kind, absolute path)
+        self.loaded = {}  # Asset name -> loaded asset
+        self.groups = {}  # Group name -> list of asset names
+        self.transient = set()  # Names of the transient sounds
+
+        # Diagnostics, filled in as assets are loaded.
+        self.load_times = {}  # Asset name -> load time in seconds
+
+        # Atlas that "atlas" assets are taken from, see projectSS.atlas. Set by Game.
+        self.atlas = None
+
+        # Volume applied to every sound when it is loaded. Changed through set_sound_volume().
+        self.sound_volume = 1.0
+
+    def register(self, name, kind, path):
+        """
+        Registers an asset without loading it.
+
+        :param name: The name used to access the asset.
+        :param kind: "image", "atlas", "sound" or "file". File assets are returned as their absolute path.
+        :param path: Path of the asset, relative to the projectSS package directory. The frame name for atlas assets.
+        """
+        self.sources[name] = (kind, path if kind == "atlas" else os.path.join(self.abs_dir, path))
+        if kind == "sound" and os.path.getsize(self.sources[name][1]) > self.TRANSIENT_SOUND_SIZE:
+            self.transient.add(name)
+
+    def register_group(self, group, names):
+        """
+        Registers a preload group, a list of assets that a game screen will need.
+        """
+        self.groups[group] = list(names)
+
+    def __getitem__(self, name):
+        asset = self.loaded.get(name)
+        if asset is None:
+            asset = self.load(name)
+        return asset
+
+    def __contains__(self, name):
+        return name in self.sources
+
+    def load(self, name):
+        """
+        Loads an asset from disk if it isn't already loaded.
+
+        :param name: The registered name of the asset.
+        :return: The loaded asset.
+        """
+        if name in self.loaded:
+            return self.loaded[name]
+
+        kind, path = self.sources[name]
+        start = time.perf_counter()
+        if kind == "image":
+            asset = pygame.image.load(path)
+            # Convert once to the display format so blitting doesn't pay for the conversion every frame.
+            asset = asset.convert_alpha() if asset.get_flags() & pygame.SRCALPHA else asset.convert()
+        elif kind == "atlas":
+            asset = self.atlas[path]
+        elif kind == "sound":
+            asset = pygame.mixer.Sound(path)
+            asset.set_volume(self.sound_volume)
+        else:
+            asset = path
+        self.load_times[name] = time.perf_counter() - start
+
+        self.loaded[name] = asset
+        return asset
+
+    def preload(self, group):
+        """
+        Loads every asset in the given group that isn't loaded yet.
+        """
+        for name in self.groups[group]:
+            self.load(name)
+
+    def release_transient(self):
+        """
+        Drops the loaded transient sounds. A sound that is still playing is freed once it's done.
+        """
+        for name in self.transient:
+            self.loaded.pop(name, None)
+
+    def set_sound_volume(self, volume):
+        """
+        Sets the volume of all loaded sounds, and of sounds loaded later on.
+        """
+        self.sound_volume = volume
+        for name, asset in self.loaded.items():
+            if self.sources[name][0] == "sound":
+                asset.set_volume(volume)
+
+    def memory(self, name):
+        """
+        Returns the approximate amount of memory in bytes used by a loaded asset. Atlas frames share the atlas' memory
+        and count as 0.
+        """
+        asset = self.loaded.get(name)
+        if asset is None:
+            return 0
+
+        kind = self.sources[name][0]
+        if kind == "image":
+            return asset.get_width() * asset.get_height() * asset.get_bytesize()
+        elif kind == "sound":
+            frequency, size, channels = pygame.mixer.get_init()
+            return int(asset.get_length() * frequency) * channels * (abs(size) // 8)
+        return 0
+
+    def audio_memory(self):
+        """
+        Returns the memory used by loaded sounds.
+
+        :return: Tuple of (bytes of resident sounds, bytes of transient sounds).
+        """
+        resident = transient = 0
+        for name in self.loaded:
+            if self.sources[name][0] == "sound":
+                if name in self.transient:
+                    transient += self.memory(name)
+                else:
+                    resident += self.memory(name)
+        return resident, transient
+
+    def report(self):
+        """
+        Returns load time and memory usage of every loaded asset.
+
+        :return: List of (name, load time in milliseconds, memory in bytes), in load order.
+        """
+        return [(name, self.load_times[name] * 1000, self.memory(name)) for name in self.loaded]
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import pygame
+
+# --------------- Texture atlas --------------- #
+#
+#   Every sprite sheet and small GUI image is packed into one image, assets/atlas.png, with an index of where each
+#   image ended up in assets/atlas.json. The game decodes the atlas once at startup and hands out subsurfaces of it by
+#   name, instead of decoding two dozen files. Backgrounds are full screen images and stay separate.
+#
+#   Rebuild the atlas after changing one of the images below:
+#       python -m projectSS.atlas
+#
+#   The index records a hash of every image. The game trusts the atlas and doesn't read the images at all, check that
+#   none of them changed since the atlas was built with:
+#       python -m projectSS.atlas --check
+
+# Images packed into the atlas, relative to the assets directory. Frames are named after the file, without extension.
+ATLAS_IMAGES = ("boss_sprite.png",
+                "circle.png",
+                "disc.png",
+                "exit.png",
+                "exit_light.png",
+                "invinc_spritesheetre.png",
+                "jumpboost_flashr.png",
+                "minigame.png",
+                "minigame_light.png",
+                "minus.png",
+                "minus-light.png",
+                "musical_notes.png",
+                "play.png",
+                "play_light.png",
+                "player_spritesheet.png",
+                "plus.png",
+                "plus_light.png",
+                "pusherspritesheetr.png",
+                "retry.png",
+                "retry_light.png",
+                "settings.png",
+                "settings_light.png")
+
+ATLAS_FILE = "atlas.png"
+INDEX_FILE = "atlas.json"
+MAX_WIDTH = 512  # Width of the atlas. Images are placed in rows (shelves) up to this width.
+PADDING = 1  # Transparent pixels between two images.
+
+
+def frame_name(filename):
+    return os.path.splitext(filename)[0]
+
+
+def source_hashes(assets_dir):
+    """
+    :return: Dictionary of image filename -> SHA-1 of the file, for every image in ATLAS_IMAGES.
+    """
+    hashes = {}
+    for filename in ATLAS_IMAGES:
+        with open(os.path.join(assets_dir, filename), "rb") as f:
+            hashes[filename] = hashlib.sha1(f.read()).hexdigest()
+    return hashes
+
+
+def pack(sizes, max_width=MAX_WIDTH, padding=PADDING):
+    """
+    Shelf packing: places rectangles in rows, tallest first, starting a new row when the current one is full.
+
+    :param sizes: Dictionary of name -> (width, height).
+    :param max_width: Width of the packed image.
+    :param padding: Gap between two rectangles.
+    :return: Tuple of (dictionary of name -> (x, y, width, height), (packed width, packed height)).
+    """
+    rects = {}
+    x = y = shelf_height = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], -item[1][0], item[0])):
+        if w > max_width:
+            raise ValueError("%s is wider than the atlas" % name)
+        if x + w > max_width:
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        rects[name] = (x, y, w, h)
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+    return rects, (max_width, y + shelf_height)
+
+
+class Atlas:
+    """
+    A packed texture atlas. Accessed like a dictionary of frame name -> surface. Frames are subsurfaces sharing the
+    atlas' pixels, so they must not be drawn on.
+    """
+
+    def __init__(self, surface, rects, sources=None):
+        """
+        :param surface: The packed atlas image.
+        :param rects: Dictionary of frame name -> (x, y, width, height) in the atlas image.
+        :param sources: Dictionary of image filename -> SHA-1 of the images the atlas was built from.
+        """
+        self.surface = surface
+        self.rects = rects
+        self.sources = sources
+        self.frames = {}  # Subsurfaces by frame name, created on first use
+
+    def __getitem__(self, name):
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self.surface.subsurface(self.rects[name])
+            self.frames[name] = frame
+        return frame
+
+    def __contains__(self, name):
+        return name in self.rects
+
+    @classmethod
+    def build(cls, assets_dir):
+        """
+        Packs the ATLAS_IMAGES from the assets directory into a new atlas.
+        """
+        images = {frame_name(f): pygame.image.load(os.path.join(assets_dir, f)) for f in ATLAS_IMAGES}
+        rects, size = pack({name: image.get_size() for name, image in images.items()})
+
+        surface = pygame.Surface(size, pygame.SRCALPHA, 32)
+        surface.fill((0, 0, 0, 0))
+        for name, image in images.items():
+            # Adding onto the cleared atlas copies the pixels exactly, where a normal blit would blend them.
+            surface.blit(image, rects[name][:2], special_flags=pygame.BLEND_RGBA_ADD)
+        return cls(surface, rects, source_hashes(assets_dir))
+
+    @classmethod
+    def load(cls, assets_dir):
+        """
+        Loads the prebuilt atlas from the assets directory. If it's missing or doesn't match ATLAS_IMAGES, the atlas is
+        built in memory from the separate images instead. Whether the images changed since is left to stale_images().
+        """
+        atlas = None
+        try:
+            with open(os.path.join(assets_dir, INDEX_FILE)) as f:
+                index = json.load(f)
+            rects = {name: tuple(rect) for name, rect in index["frames"].items()}
+            if set(rects) == set(frame_name(f) for f in ATLAS_IMAGES):
+                atlas = cls(pygame.image.load(os.path.join(assets_dir, ATLAS_FILE)), rects, index.get("sources"))
+        except (OSError, ValueError, KeyError, TypeError, pygame.error):
+            pass
+        if atlas is None:
+            atlas = cls.build(assets_dir)
+
+        # Convert once to the display format, like the AssetManager does for its images.
+        if pygame.display.get_surface() is not None:
+            atlas.surface = atlas.surface.convert_alpha()
+        return atlas
+
+    @staticmethod
+    def stale_images(assets_dir):
+        """
+        Compares the images with the hashes recorded when the prebuilt atlas was built. Reads every image, so it's only
+        meant for the build step.
+
+        :return: Sorted list of the filenames of the images that changed or were added since.
+        """
+        try:
+            with open(os.path.join(assets_dir, INDEX_FILE)) as f:
+                recorded = json.load(f).get("sources") or {}
+        except (OSError, ValueError):
+            recorded = {}
+        return sorted(filename for filename, sha1 in source_hashes(assets_dir).items() if recorded.get(filename) != sha1)
+
+    def save(self, assets_dir):
+        """
+        Writes the atlas image and its index to the assets directory.
+        """
+        pygame.image.save(self.surface, os.path.join(assets_dir, ATLAS_FILE))
+        # One frame and one source per line, so changes to the atlas are readable in a diff.
+        frames = ",\n".join('    %s: %s' % (json.dumps(name), json.dumps(list(rect)))
+                            for name, rect in sorted(self.rects.items()))
+        sources = ",\n".join('    %s: %s' % (json.dumps(filename), json.dumps(sha1))
+                             for filename, sha1 in sorted(self.sources.items()))
+        with open(os.path.join(assets_dir, INDEX_FILE), "w") as f:
+            f.write('{\n  "size": %s,\n  "frames": {\n%s\n  },\n  "sources": {\n%s\n  }\n}\n'
+                    % (json.dumps(list(self.surface.get_size())), frames, sources))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Packs the sprite sheets and GUI images into the texture atlas.")
+    parser.add_argument("--assets", default=os.path.join(os.path.dirname(__file__), "assets"),
+                        help="assets directory to read the images from and write the atlas to")
+    parser.add_argument("--check", action="store_true",
+                        help="only check whether the atlas is up to date with the images, instead of rebuilding it")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        stale = Atlas.stale_images(args.assets)
+        for filename in stale:
+            print("%s changed since the atlas was built" % filename)
+        print("atlas is out of date, rebuild it with: python -m projectSS.atlas" if stale else "atlas is up to date")
+        return 1 if stale else 0
+
+    atlas = Atlas.build(args.assets)
+    atlas.save(args.assets)
+    width, height = atlas.surface.get_size()
+    used = sum(w * h for _, _, w, h in atlas.rects.values())
+    print("packed %d images into %dx%d, %.0f%% used" % (len(atlas.rects), width, height, 100 * used / (width * height)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
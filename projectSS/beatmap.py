@@ -0,0 +1,350 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# NumPy is optional. It is only needed to analyze tracks, not to load the cached beat maps.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# --------------- Beat maps --------------- #
+#
+#   A beat map holds the tempo and the time of the first beat of a music track. The analyzer below detects them
+#   offline and caches them next to the track as <track>.beatmap.json, keyed by the SHA-1 of the track file. At level
+#   start GameplayScreen only loads the cached map; tracks without one keep the values set in set_level_variables().
+#   Checking a map means hashing its track, so GameplayScreen preloads the maps of the level tracks in the background.
+#
+#   Analyze every track in the assets folder, one process per core:
+#       python -m projectSS.beatmap
+
+ANALYZER_VERSION = 2
+SUFFIX = ".beatmap.json"
+
+SAMPLE_RATE = 22050  # Tracks are decoded to mono at this rate for the analysis
+FRAME_SIZE = 1024  # Samples per spectrum
+HOP_SIZE = 512  # Samples between two spectra
+MIN_BPM = 70
+MAX_BPM = 180
+OCTAVE_SCORE_RATIO = 0.7  # Twice the detected tempo is used if its grid scores at least this well, see fit_grid()
+
+# Beat maps already loaded by this process, by track path: (modification time, size, beat map or None).
+loaded = {}
+# Beat maps being loaded in the background, by track path: Future of the beat map or None.
+preloading = {}
+preloader = None  # Thread loading the beat maps, started by the first preload_beatmaps()
+
+
+def beatmap_path(track_path):
+    return track_path + SUFFIX
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def load_beatmap(track_path):
+    """
+    Returns the cached beat map of a track, or None if there isn't one for the track's current contents.
+
+    :param track_path: Absolute path of the music track.
+    :return: Dictionary with "bpm" and "offset", or None.
+    """
+    future = preloading.pop(track_path, None)
+    if future is not None:
+        # The preloaded map is cached in loaded, read_beatmap() still checks that the track didn't change since.
+        future.result()
+    return read_beatmap(track_path)
+
+
+def read_beatmap(track_path):
+    try:
+        stat = os.stat(track_path)
+    except OSError:
+        return None
+    cached = loaded.get(track_path)
+    if cached is not None and cached[:2] == (stat.st_mtime, stat.st_size):
+        return cached[2]
+
+    beatmap = None
+    try:
+        with open(beatmap_path(track_path)) as f:
+            data = json.load(f)
+        if data.get("analyzer") == ANALYZER_VERSION and data.get("sha1") == file_hash(track_path):
+            beatmap = {"bpm": float(data["bpm"]), "offset": float(data["offset"])}
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    loaded[track_path] = (stat.st_mtime, stat.st_size, beatmap)
+    return beatmap
+
+
+def preload_beatmaps(*track_paths):
+    """
+    Starts loading the beat maps of the tracks in the background, so load_beatmap() doesn't have to hash them.
+
+    :param track_paths: Absolute paths of the music tracks.
+    """
+    global preloader
+    if preloader is None:
+        preloader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="BeatmapLoader")
+    for track_path in track_paths:
+        if track_path not in loaded and track_path not in preloading:
+            preloading[track_path] = preloader.submit(read_beatmap, track_path)
+
+
+# --------------- Analysis --------------- #
+
+def decode(track_path):
+    """
+    Decodes a track to mono samples at SAMPLE_RATE, using pygame's mixer.
+
+    :return: numpy array of float samples.
+    """
+    import pygame
+    if pygame.mixer.get_init() != (SAMPLE_RATE, -16, 1):
+        pygame.mixer.quit()
+        pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=1)
+    samples = pygame.sndarray.array(pygame.mixer.Sound(track_path))
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    return samples.astype(numpy.float64) / 32768
+
+
+def onset_envelope(samples):
+    """
+    Spectral flux: how much louder each frequency got from one frame to the next, summed over all frequencies.
+
+    :return: numpy array with one value per hop.
+    """
+    frames = 1 + (len(samples) - FRAME_SIZE) // HOP_SIZE
+    if frames < 2:
+        raise ValueError("Track is too short to analyze")
+    index = numpy.arange(FRAME_SIZE)[None, :] + HOP_SIZE * numpy.arange(frames)[:, None]
+    spectra = numpy.abs(numpy.fft.rfft(samples[index] * numpy.hanning(FRAME_SIZE), axis=1))
+    spectra = numpy.log1p(100 * spectra)
+    flux = numpy.maximum(spectra[1:] - spectra[:-1], 0).sum(axis=1)
+    flux = numpy.concatenate(([0.0], flux))
+    # Only keep what stands out from the local average.
+    window = numpy.ones(16) / 16
+    flux = numpy.maximum(flux - numpy.convolve(flux, window, mode="same"), 0)
+    return flux
+
+
+def detect_tempo(envelope):
+    """
+    Finds the beat period as the strongest autocorrelation lag of the onset envelope within MIN_BPM to MAX_BPM.
+
+    :return: Tempo in beats per minute.
+    """
+    hop_time = HOP_SIZE / SAMPLE_RATE
+    centered = envelope - envelope.mean()
+    n = len(centered)
+    spectrum = numpy.fft.rfft(centered, 2 * n)
+    correlation = numpy.fft.irfft(spectrum * numpy.conj(spectrum))[:n]
+
+    min_lag = max(1, int(60 / MAX_BPM / hop_time))
+    max_lag = min(n - 2, int(60 / MIN_BPM / hop_time) + 1)
+    if max_lag <= min_lag:
+        raise ValueError("Track is too short to analyze")
+    lag = min_lag + int(numpy.argmax(correlation[min_lag:max_lag + 1]))
+
+    # Parabolic interpolation between the neighbouring lags for a tempo finer than one hop.
+    left, center, right = correlation[lag - 1], correlation[lag], correlation[lag + 1]
+    denominator = left - 2 * center + right
+    shift = 0.5 * (left - right) / denominator if denominator != 0 else 0
+    return 60 / ((lag + shift) * hop_time)
+
+
+def grid_score(envelope, bpm):
+    """
+    Lines a beat grid of the given tempo up with the onset envelope at every phase.
+
+    :return: Tuple of (score of the best phase, the best phase in hops).
+    """
+    period = 60 / bpm / (HOP_SIZE / SAMPLE_RATE)  # Beat period in hops
+    beats = numpy.arange(0, len(envelope) - period, period)
+    phases = numpy.arange(0, period, 0.25)
+    scores = numpy.interp(beats[None, :] + phases[:, None], numpy.arange(len(envelope)), envelope).sum(axis=1)
+    best = int(numpy.argmax(scores))
+    return scores[best] / len(beats), phases[best]
+
+
+def refine_tempo(envelope, bpm):
+    """
+    Searches the tempos within 2% of an estimate for the beat grid that lines up with the most onsets.
+
+    :return: Tuple of (score of the grid, its tempo in beats per minute, its phase in hops).
+    """
+    candidates = numpy.arange(bpm * 0.98, bpm * 1.02, 0.01)
+    fits = [grid_score(envelope, candidate) for candidate in candidates]
+    best = max(range(len(fits)), key=lambda i: fits[i][0])
+    return fits[best][0], float(candidates[best]), fits[best][1]
+
+
+def fit_grid(envelope, bpm):
+    """
+    Refines a tempo estimate to the beat grid that lines up with the most onsets over the whole track, and finds its
+    first beat.
+
+    :return: Tuple of (tempo in beats per minute, time in seconds of the first beat).
+    """
+    score, bpm, phase = refine_tempo(envelope, bpm)
+    # The autocorrelation is as strong at twice the beat period, so the estimate may be half the tempo. Every beat of
+    # the real tempo lines up with an onset, so its grid scores about as well per beat. At half the real tempo, the
+    # doubled grid puts every other beat between two onsets and scores much lower.
+    if bpm * 2 <= MAX_BPM * 1.02:
+        double = refine_tempo(envelope, bpm * 2)
+        if double[0] >= OCTAVE_SCORE_RATIO * score:
+            score, bpm, phase = double
+    # Hop i covers the samples from i * HOP_SIZE, an onset shows the most when it's in the middle of the frame.
+    offset = (phase * HOP_SIZE + FRAME_SIZE / 2) / SAMPLE_RATE
+    return bpm, float(offset % (60 / bpm))
+
+
+def analyze(track_path):
+    """
+    Detects the tempo and first beat of a track.
+
+    :return: Dictionary with "bpm" and "offset".
+    """
+    if numpy is None:
+        raise RuntimeError("Analyzing tracks needs NumPy, install it with: pip install numpy")
+    return analyze_samples(decode(track_path))
+
+
+def analyze_samples(samples):
+    """
+    Detects the tempo and first beat of mono samples at SAMPLE_RATE.
+
+    :return: Dictionary with "bpm" and "offset".
+    """
+    envelope = onset_envelope(samples)
+    bpm, offset = fit_grid(envelope, detect_tempo(envelope))
+    return {"bpm": round(bpm, 2), "offset": round(offset, 3)}
+
+
+# --------------- Self-check --------------- #
+#
+#   The analyzer has to find the tempo of synthetic click tracks over the whole tempo range, including the level
+#   tempos, without mistaking them for half or double the tempo. Run it after changing the analysis:
+#       python -m projectSS.beatmap --check
+
+CHECK_TEMPOS = tuple(range(MIN_BPM, MAX_BPM + 1, 5)) + (140, 165, 166)
+CHECK_BPM_TOLERANCE = 0.002  # Fraction of the tempo
+CHECK_OFFSET_TOLERANCE = 0.015  # Seconds
+
+
+def click_track(bpm, offset, seconds=30, seed=0):
+    """
+    :return: numpy array of mono samples at SAMPLE_RATE, with a short noise burst on every beat from offset on.
+    """
+    rng = numpy.random.default_rng(seed)
+    length = int(0.02 * SAMPLE_RATE)
+    click = 0.5 * rng.standard_normal(length) * numpy.exp(-numpy.arange(length) / (0.004 * SAMPLE_RATE))
+    samples = numpy.zeros(int(seconds * SAMPLE_RATE))
+    for beat in numpy.arange(offset, seconds, 60 / bpm):
+        start = int(round(beat * SAMPLE_RATE))
+        samples[start:start + length] += click[:len(samples) - start]
+    return samples
+
+
+def check():
+    """
+    Analyzes a click track at each of the CHECK_TEMPOS.
+
+    :return: List of (tempo, offset, beat map) of the click tracks that weren't analyzed within tolerance.
+    """
+    failures = []
+    for i, bpm in enumerate(CHECK_TEMPOS):
+        offset = (0.05 + 0.037 * i) % (60 / bpm)
+        beatmap = analyze_samples(click_track(bpm, offset, seed=i))
+        # The offset may be found a whole beat around.
+        offset_error = abs((beatmap["offset"] - offset + 30 / bpm) % (60 / bpm) - 30 / bpm)
+        if abs(beatmap["bpm"] - bpm) > CHECK_BPM_TOLERANCE * bpm or offset_error > CHECK_OFFSET_TOLERANCE:
+            failures.append((bpm, offset, beatmap))
+    return failures
+
+
+def analyze_file(track_path, force=False):
+    """
+    Analyzes a track and writes its beat map next to it, unless an up to date one is already there.
+
+    :param force: Analyze even if the cached beat map is up to date.
+    :return: Tuple of (track path, beat map, True if it was analyzed now).
+    """
+    sha1 = file_hash(track_path)
+    if not force:
+        try:
+            with open(beatmap_path(track_path)) as f:
+                data = json.load(f)
+            if data.get("sha1") == sha1 and data.get("analyzer") == ANALYZER_VERSION:
+                return track_path, {"bpm": data["bpm"], "offset": data["offset"]}, False
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    beatmap = analyze(track_path)
+    data = {"track": os.path.basename(track_path), "sha1": sha1, "analyzer": ANALYZER_VERSION}
+    data.update(beatmap)
+    temp_path = beatmap_path(track_path) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    os.replace(temp_path, beatmap_path(track_path))
+    return track_path, beatmap, True
+
+
+def init_worker():
+    # Workers decode with pygame's mixer, which mustn't open the audio device.
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detects tempo and first beat offset of music tracks and caches "
+                                                 "them as beat maps next to the tracks.")
+    parser.add_argument("tracks", nargs="*", metavar="TRACK",
+                        help="tracks to analyze, by default every .mp3 and .ogg file in the assets folder")
+    parser.add_argument("--assets", default=os.path.join(os.path.dirname(__file__), "assets"),
+                        help="folder analyzed when no tracks are given")
+    parser.add_argument("--force", action="store_true", help="analyze tracks even if their beat map is up to date")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="number of tracks analyzed in parallel")
+    parser.add_argument("--check", action="store_true", help="check the analyzer on synthetic click tracks instead")
+    args = parser.parse_args(argv)
+
+    if numpy is None:
+        parser.error("analyzing tracks needs NumPy, install it with: pip install numpy")
+
+    if args.check:
+        failures = check()
+        for bpm, offset, beatmap in failures:
+            print("click track at %d BPM, first beat at %.3f s: analyzed as %.2f BPM, first beat at %.3f s"
+                  % (bpm, offset, beatmap["bpm"], beatmap["offset"]))
+        print("%d of %d click tracks analyzed correctly" % (len(CHECK_TEMPOS) - len(failures), len(CHECK_TEMPOS)))
+        return 1 if failures else 0
+
+    tracks = args.tracks or sorted(os.path.join(args.assets, name) for name in os.listdir(args.assets)
+                                   if name.lower().endswith((".mp3", ".ogg")))
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), initializer=init_worker) as executor:
+        futures = [executor.submit(analyze_file, os.path.abspath(track), args.force) for track in tracks]
+        for track, future in zip(tracks, futures):
+            try:
+                _, beatmap, analyzed = future.result()
+            except Exception as e:
+                failed += 1
+                print("%s: failed, %s" % (track, e))
+                continue
+            print("%s: %.2f BPM, first beat at %.3f s%s" % (track, beatmap["bpm"], beatmap["offset"],
+                                                           "" if analyzed else " (cached)"))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
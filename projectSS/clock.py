@@ -0,0 +1,85 @@
+class SongClock:
+    """
+    Position in the current song, in seconds. The rhythm mechanic and everything moving with the beat read it, once
+    per game logic step.
+
+    With sync_to_music set, as in normal play, it follows the playback position of the music. That keeps the beat locked
+    to what the player hears, even after hitches the game logic doesn't catch up on. Otherwise, when recording or
+    playing back a replay and in the headless simulation, it is derived from the game logic clock, Game.sim_time, so
+    runs stay reproducible. Either way it stands still while paused.
+    """
+
+    def __init__(self, music=None):
+        """
+        :param music: projectSS.music.MusicPlayer playing the song, needed for sync_to_music.
+        """
+        self.music = music
+        self.start_time = 0  # Game time at which the song started, moved forward by pauses.
+        self.paused_at = None  # Game time at which the song was paused, None while playing.
+        self.sync_to_music = False
+
+    def start(self, now):
+        """
+        Restarts the song. Call right after starting the music.
+
+        :param now: Current game time in seconds.
+        """
+        self.start_time = now
+        self.paused_at = None
+
+    def pause(self, now):
+        if self.paused_at is None:
+            self.paused_at = now
+
+    def resume(self, now):
+        if self.paused_at is not None:
+            self.start_time += now - self.paused_at
+            self.paused_at = None
+
+    def time(self, now):
+        """
+        :param now: Current game time in seconds.
+        :return: Position in the song in seconds.
+        """
+        if self.sync_to_music and self.music is not None:
+            position = self.music.elapsed()
+            if position is not None:
+                return position
+        if self.paused_at is not None:
+            now = self.paused_at
+        return now - self.start_time
+
+
+class BeatGrid:
+    """
+    Beat timeline of a track, precomputed from its BPM and offset. Finding the beats around a point in time is a single
+    division, no matter how far into the song it is.
+    """
+
+    def __init__(self, bpm, offset, divisions=1, threshold=0.5):
+        """
+        :param bpm: Beats per minute of the track.
+        :param offset: Time in seconds to the first beat.
+        :param divisions: Divisions of a beat (2, 4 = faster, 0.5, 0.25 = slower).
+        :param threshold: Fraction of the time between two beats that counts as on beat, centered on the beat.
+        """
+        self.offset = offset
+        self.beat_time = 60 / (bpm * divisions)  # Time between two beats
+        self.window = self.beat_time * (threshold / 2)  # Maximum distance to a beat that counts as on beat
+
+    def lookup(self, song_time):
+        """
+        :param song_time: Position in the song in seconds.
+        :return: Tuple of (previous beat time, next beat time, time to the closest beat). Beat times are relative to
+            the first beat.
+        """
+        beat_time = self.beat_time
+        cur_time = song_time - self.offset
+        prev_beat = int(cur_time / beat_time) * beat_time
+        next_beat = int((cur_time + beat_time) / beat_time) * beat_time
+        prev_beat_time = cur_time - prev_beat
+        next_beat_time = next_beat - cur_time
+        return prev_beat, next_beat, prev_beat_time if prev_beat_time < next_beat_time else next_beat_time
+
+    def on_beat(self, song_time):
+        return self.lookup(song_time)[2] <= self.window
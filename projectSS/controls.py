@@ -0,0 +1,86 @@
+import pygame
+from pygame.locals import *
+
+# Keys that make the player jump.
+JUMP_KEYS = (K_SPACE, K_UP, K_w)
+
+# Jump offsets are rounded to this many seconds, the precision they are stored with in replays.
+JUMP_OFFSET_UNIT = 0.0001
+# Jump offsets are clamped to this many seconds around their step. Anything further off is a hitch, not timing.
+MAX_JUMP_OFFSET = 0.1
+
+
+class Controls:
+    """
+    Player input for one game logic step. Game.update() calls poll() once per step, the gameplay reads the resulting
+    booleans instead of polling the keyboard itself. This lets the game be driven by something other than the keyboard.
+    """
+
+    def __init__(self):
+        self.left = False
+        self.right = False
+        self.jump = False
+        self.pause = False
+
+        # When the jump key was pressed, in seconds relative to the game time of this step. Lets the rhythm mechanic
+        # judge a jump at the moment the key went down rather than at the step that handles it. None if the jump key
+        # wasn't pressed since the last step, or if the press time isn't known, in which case jumps are judged at the
+        # step's time.
+        self.jump_offset = None
+
+        # Mouse state, copied to Game.mouse_clicked and Game.mouse_pos each step.
+        self.click = False
+        self.mouse_pos = (-1, -1)
+
+    def poll(self, game):
+        """
+        Updates the input state for the next game logic step.
+
+        :param game: The Game object. Holds the jump key press and the mouse clicks reported by the window events.
+        """
+        pass
+
+
+class KeyboardControls(Controls):
+    """
+    The default controls, read from the keyboard.
+    """
+
+    def poll(self, game):
+        pressed_keys = pygame.key.get_pressed()
+        self.left = bool(pressed_keys[K_LEFT] or pressed_keys[K_a])
+        self.right = bool(pressed_keys[K_RIGHT] or pressed_keys[K_d])
+        self.jump = any(pressed_keys[key] for key in JUMP_KEYS)
+        self.pause = bool(pressed_keys[K_p] or pressed_keys[K_ESCAPE])
+
+        # Jump key press reported by the window events, handled by the first step after it.
+        self.jump_offset = None
+        if game.jump_press_time is not None:
+            offset = max(-MAX_JUMP_OFFSET, min(MAX_JUMP_OFFSET, game.jump_press_time - game.sim_time))
+            self.jump_offset = round(offset / JUMP_OFFSET_UNIT) * JUMP_OFFSET_UNIT
+
+        # One click per step, at the position it was made. Clicks made in the same frame go to the following steps.
+        if game.click_queue:
+            self.click = True
+            self.mouse_pos = game.click_queue.popleft()
+        else:
+            self.click = False
+            self.mouse_pos = pygame.mouse.get_pos()
+
+
+class ScriptedControls(Controls):
+    """
+    Controls driven by a script instead of a player. Used by the headless simulation.
+    """
+
+    def __init__(self, script):
+        """
+        :param script: Function taking the step number and returning a (left, right, jump, pause) tuple.
+        """
+        super().__init__()
+        self.script = script
+        self.tick = 0
+
+    def poll(self, game):
+        self.left, self.right, self.jump, self.pause = self.script(self.tick)
+        self.tick += 1
@@ -0,0 +1,38 @@
+import pygame
+
+
+class DirtyRectTracker:
+    """
+    Collects the regions of the screen that changed during a frame, so that Game.render() only has to push those
+    regions to the display instead of the whole window.
+    """
+
+    def __init__(self):
+        self.rects = []  # Changed regions of the current frame.
+        self.full = False  # True if the whole screen changed.
+
+    def add(self, rect):
+        self.rects.append(rect)
+
+    def add_all(self, rects):
+        self.rects.extend(rects)
+
+    def invalidate(self):
+        """
+        Marks the whole screen as changed.
+        """
+        self.full = True
+
+    def flush(self):
+        """
+        Updates the changed regions of the display and starts a new frame.
+        """
+        if self.full:
+            pygame.display.update()
+        elif self.rects:
+            pygame.display.update(self.rects)
+        self.clear()
+
+    def clear(self):
+        self.rects.clear()
+        self.full = False
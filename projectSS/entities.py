@@ -1,26 +1,61 @@
 import math
-import time
-import random
-import os.path
 from pygame.locals import *
 from pygame.math import Vector2
 from abc import ABC
 from projectSS.spritesheet import *
+from projectSS.spatial import BandedGroup
+from projectSS.hazards import HazardArrays
 
 
 # Abstract entity class
 class Entity(pygame.sprite.Sprite, ABC):
     def __init__(self, gameplay_screen, *groups):
+        # The rect has to exist before joining the groups, BandedGroups index it.
+        self.surf = pygame.Surface((0, 0))
+        self.rect = self.surf.get_rect()
+        self.rect_render = self.surf.get_rect()
+        # Surface the size of rect was last taken from.
+        self.rect_surf = self.surf
+
         super().__init__(groups)
         self.gameplay_screen = gameplay_screen
         self.game = gameplay_screen.game
 
-        self.surf = pygame.Surface((0, 0))
-        self.rect = self.surf.get_rect()
-        self.rect_render = self.surf.get_rect()
+        # Groups with a spatial index that has to follow this entity's rect.
+        self.indexes = tuple(g for g in groups if isinstance(g, BandedGroup))
+        # Groups a pooled entity rejoins when it is reused.
+        self.spawn_groups = groups
+        # EntityPool this entity goes back to when killed, None if it isn't pooled.
+        self.pool = None
+        self.in_pool = False
+        # Slot in gameplay_screen.hazards if the entity is simulated by the NumPy backend, otherwise None.
+        self.slot = None
 
         self.pos = Vector2(0, 0)
         self.last_pos = self.pos
+        # Position at the start of the current game logic step. None until the first step after spawning.
+        self.prev_pos = None
+
+    # Called at the start of each game logic step, so rendering can interpolate from this position
+    def save_position(self):
+        if self.prev_pos is None:
+            self.prev_pos = Vector2(self.pos)
+        else:
+            self.prev_pos.update(self.pos)
+
+    # Screen position of the entity's center, interpolated between the last two game logic steps
+    def render_center(self):
+        camera_y = self.gameplay_screen.render_camera_y
+        if self.prev_pos is None:
+            return self.pos.x, self.pos.y - camera_y
+
+        alpha = self.game.alpha
+        x = self.pos.x
+        # Don't interpolate across the screen when wrapping around its border
+        if abs(x - self.prev_pos.x) < self.game.WIDTH / 2:
+            x = self.prev_pos.x + (x - self.prev_pos.x) * alpha
+        y = self.prev_pos.y + (self.pos.y - self.prev_pos.y) * alpha
+        return x, y - camera_y
 
     def update(self):
         if self.pos.y > self.gameplay_screen.despawn_y:
@@ -28,13 +63,30 @@ class Entity(pygame.sprite.Sprite, ABC):
 
         self.update_rect()
 
-    def update_rect(self):
-        self.rect = self.surf.get_rect(center=self.pos)
-        self.rect_render = self.surf.get_rect(
-            center=(self.pos.x, self.pos.y - self.gameplay_screen.camera_y))
+    def kill(self):
+        super().kill()
+        if self.slot is not None:
+            self.gameplay_screen.hazards.remove(self)
+        if self.pool is not None:
+            self.pool.release(self)
 
+    # Moves rect to the current position. The rect is updated in place, its size only when the surface changed.
+    def update_rect(self):
+        rect = self.rect
+        if self.surf is not self.rect_surf:
+            self.rect_surf = self.surf
+            rect.size = self.surf.get_size()
+        rect.center = self.pos
+        for index in self.indexes:
+            index.reindex(self)
+
+    # Returns the region of the screen that was drawn to. Only called for entities in view, so rect_render, the
+    # position on screen, is only kept up to date here.
     def render(self):
-        self.game.screen.blit(self.surf, self.rect_render)
+        rect_render = self.rect_render
+        rect_render.size = self.rect.size
+        rect_render.center = self.render_center()
+        return self.game.screen.blit(self.surf, rect_render)
 
 
 # For now, player will be represented with red squares.
@@ -43,8 +95,7 @@ class Player(Entity):
         super().__init__(gameplay_screen)
 
         # This can be refactor if needed, but uses the Spritesheet class to load and pick out images
-        abs_dir = os.path.dirname(__file__)
-        self.player_spritesheet = Spritesheet(os.path.join(abs_dir, 'assets/player_spritesheet.png'))
+        self.player_spritesheet = Spritesheet.from_atlas(self.game.atlas, 'player_spritesheet')
         # Variables for animation/switching of sprites
         self.play_walk = False
         self.play_jump = False
@@ -140,6 +191,16 @@ class Player(Entity):
         self.pushed = False
         self.push_time = 0
 
+        self.prev_pos = None
+
+        # Animation state. Affects the size of the player's hitbox, so runs have to start with the same state.
+        self.play_walk = False
+        self.play_jump = False
+        self.current_frame = 0
+        self.last_update = 0
+        self.last_direction = False
+        self.surf = self.idle_walk_frames_r[0]
+
     # This method allows us to control our player. Heavy use of physics and kinematics.
     def move(self):
         # Reset acceleration, or else player ends up wobbling back and forth
@@ -150,19 +211,19 @@ class Player(Entity):
         if not self.on_ground:
             self.acc.y = self.GRAVITY
 
-        # Check if any keyboard keys have been pressed. Modify acceleration/velocity accordingly.
-        pressed_keys = pygame.key.get_pressed()
-        if pressed_keys[K_LEFT] or pressed_keys[K_a]:
+        # Check if any movement controls have been pressed. Modify acceleration/velocity accordingly.
+        controls = self.game.controls
+        if controls.left:
             self.last_direction = False
             self.play_walk = True
             self.acc.x = -self.ACCELERATION
-        elif pressed_keys[K_RIGHT] or pressed_keys[K_d]:
+        elif controls.right:
             self.last_direction = True
             self.play_walk = True
             self.acc.x = self.ACCELERATION
 
         # Player is holding space key? Jump until max jump height is reached. Space key is let go? Stop jump.
-        if pressed_keys[K_SPACE] or pressed_keys[K_UP] or pressed_keys[K_w]:
+        if controls.jump:
             self.jump()
             self.jumping = True
             self.play_jump = True
@@ -206,8 +267,8 @@ class Player(Entity):
                 self.boosted = False
                 self.game.assets["sfx_boostjump"].play()
             else:
-                # On beat jump
-                if self.gameplay_screen.rhy_on_beat:
+                # On beat jump, judged at the moment the jump key went down
+                if self.gameplay_screen.on_beat_at(self.game.controls.jump_offset):
                     self.vel.y = -20
                     self.vel.x *= 2
                     self.game.assets["sfx_blip"].play()
@@ -239,8 +300,8 @@ class Player(Entity):
                             self.surf = self.jump_frames[0]
 
     def push(self):
-        self.vel.y = random.randrange(-15, -5)
-        self.acc.x = random.randrange(-15, 15)
+        self.vel.y = self.gameplay_screen.rng.randrange(-15, -5)
+        self.acc.x = self.gameplay_screen.rng.randrange(-15, 15)
 
     def cancel_jump(self):
         if self.jumping:
@@ -248,7 +309,7 @@ class Player(Entity):
                 self.vel.y = -5
 
     def animate_walk(self, direction_frames):
-        now = pygame.time.get_ticks()
+        now = self.game.sim_time * 1000
         if self.play_walk:
             if now - self.last_update > 150:
                 self.last_update = now
@@ -304,7 +365,7 @@ class Player(Entity):
             return
 
         # Platform collisions
-        plat_collisions = pygame.sprite.spritecollide(self, self.gameplay_screen.platforms, False)
+        plat_collisions = self.gameplay_screen.platforms.collide(self, False)
         self.on_ground = False
         
         # Ignore collisions if the player jumped this frame
@@ -335,7 +396,6 @@ class Player(Entity):
                 else:
                     self.surf = self.player_boost_frames[0]
         else:
-            cur_time = time.time()
             # changes to rhythm jump animation when on beat
             if self.gameplay_screen.rhy_on_beat:
                 self.rhythm_jump_animate()
@@ -346,7 +406,7 @@ class Player(Entity):
                     self.animate(self.idle_walk_frames_l, self.idle_walk_frames_r)
 
         # Check if player hits powerups
-        pows_collisions = pygame.sprite.spritecollide(self, self.gameplay_screen.powerups, True)
+        pows_collisions = self.gameplay_screen.powerups.collide(self, True)
         for p in pows_collisions:
             self.game.assets["sfx_pickup"].play()
             if p.type == 'boost':
@@ -355,7 +415,7 @@ class Player(Entity):
                 self.immune = True
 
         # Check if player hits enemy
-        enemy_collisions = pygame.sprite.spritecollide(self, self.gameplay_screen.enemies, True)
+        enemy_collisions = self.gameplay_screen.enemies.collide(self, True)
         if enemy_collisions:
             # If player is in IMMUNE STATE, will lose immunity after hitting 1 enemy
             if self.immune:
@@ -368,16 +428,16 @@ class Player(Entity):
                     e.kill()
 
         # Check if player hits a pusher
-        push_collisions = pygame.sprite.spritecollide(self, self.gameplay_screen.pushers, False)
+        push_collisions = self.gameplay_screen.pushers.collide(self, False)
         for p in push_collisions:
             # If player is in IMMUNE STATE, will lose immunity after hitting 1 enemy
-            if self.immune and time.time() - self.push_time > 1.0:
+            if self.immune and self.game.sim_time - self.push_time > 1.0:
                 self.game.assets["sfx_loseshield"].play()
-                self.push_time = time.time()
+                self.push_time = self.game.sim_time
                 self.immune = False
-            if p.active and time.time() - self.push_time > 1.0:
+            if p.active and self.game.sim_time - self.push_time > 1.0:
                 self.game.assets["sfx_pushed"].play()
-                self.push_time = time.time()
+                self.push_time = self.game.sim_time
                 self.pushed = True
 
         # Walking to Idle Animation transition
@@ -386,13 +446,12 @@ class Player(Entity):
         self.last_pos = self.pos
 
         # Check if player hits a boss
-        boss_collision = pygame.sprite.spritecollide(self, self.gameplay_screen.bosses, True)
+        boss_collision = self.gameplay_screen.bosses.collide(self, True)
         if boss_collision:
-            # Stop music and let SFX play for its duration before switching to minigame.
-            pygame.mixer.music.stop()
-            self.game.assets["sfx_boss"].play()
-            while pygame.mixer.get_busy():
-                continue
+            # Stop music and let SFX play for its duration before switching to minigame. Both the music and the
+            # rhythm are resumed from here after the minigame.
+            self.game.music.stop()
+            self.gameplay_screen.song_clock.pause(self.game.sim_time)
 
             # Set player's position to boss's
             self.pos = boss_collision[0].pos
@@ -401,43 +460,56 @@ class Player(Entity):
             self.vel.x = 0
             self.vel.y = 0
 
-            # Switch to minigame.
-            self.game.show_minigame_screen()
+            # Switch to minigame once the SFX is done. Gameplay is frozen until then, but the game keeps running.
+            self.game.scheduler.after_sound(self.game.assets["sfx_boss"], self.game.show_minigame_screen,
+                                            blocking=True)
 
 
 # For now, platforms will be represented with gray rectangles.
+# Platform, Enemy, Powerup and Pusher are pooled, see EntityPool. spawn() (re)initializes them.
 class Platform(Entity):
     def __init__(self, gameplay_screen, width, x, y, color, goal=False):
         super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.platforms)
-        self.surf = pygame.Surface((width, 20))
-        self.surf.fill(color)
-        
-        self.surf_inner = pygame.Surface((width - 8, 12))
-        self.surf_inner.fill((32, 32, 32))
+        self.surf_inner = None
         self.rect_render_inner = None
+        self.spawn(width, x, y, color, goal)
+
+    def spawn(self, width, x, y, color, goal=False):
+        # Surfaces are shared by all platforms of the same width and color.
+        self.surf, self.surf_inner = self.gameplay_screen.platform_surfaces(width, color)
+        self.rect_render_inner = self.surf_inner.get_rect()
         
         self.pos.x = x
         self.pos.y = y
         self.goal = goal
 
         self.update_rect()
-    
+        if self.gameplay_screen.hazards is not None:
+            self.gameplay_screen.hazards.add(self, HazardArrays.PLATFORM)
+        else:
+            self.add(self.gameplay_screen.objects)
+
     def update_rect(self):
         super().update_rect()
-        self.rect_render_inner = self.surf_inner.get_rect(
-            center=(self.pos.x, self.pos.y - self.gameplay_screen.camera_y))
+        if self.slot is not None:
+            self.gameplay_screen.hazards.place(self)
     
     def render(self):
-        super().render()
+        rect = super().render()
+        self.rect_render_inner.center = self.rect_render.center
         self.game.screen.blit(self.surf_inner, self.rect_render_inner)
+        return rect
 
 
 class Enemy(Entity):
     def __init__(self, gameplay_screen, span, x, y):
         super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.enemies)
-        self.surf = pygame.transform.scale(self.game.assets["enemy_disc"].convert_alpha(), (35, 35))
+        # Scaled once by GameplayScreen and shared by all enemies.
+        self.surf = gameplay_screen.enemy_frame
         # self.surf.fill((211, 211, 0))
+        self.spawn(span, x, y)
 
+    def spawn(self, span, x, y):
         # Vectors for simple enemy movement
         self.pos.x = x
         self.pos.y = y
@@ -445,10 +517,14 @@ class Enemy(Entity):
         self.span = span
 
         self.update_rect()
+        if self.gameplay_screen.hazards is not None:
+            self.gameplay_screen.hazards.add(self, HazardArrays.ENEMY, self.start, self.span)
+        else:
+            self.add(self.gameplay_screen.objects)
 
     def update(self):
         # Sine wave oscillation for basic enemies, could be improved
-        self.pos.x = self.start + (self.span * math.sin(time.time() *
+        self.pos.x = self.start + (self.span * math.sin(self.gameplay_screen.song_time *
                                   (self.gameplay_screen.rhy_bpm * self.gameplay_screen.rhy_beat_divisions)/120 * math.pi) + self.span)
 
         if self.pos.y > self.gameplay_screen.despawn_y:
@@ -459,12 +535,16 @@ class Enemy(Entity):
 
 class Powerup(Entity):
     def __init__(self, gameplay_screen, x, y, type):
-        super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.powerups)
+        super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.objects,
+                         gameplay_screen.powerups)
+        self.spawn(x, y, type)
+
+    def spawn(self, x, y, type):
         self.type = type
         if self.type == 'boost':
-            self.power_frames = gameplay_screen.j_boost_frames
+            self.power_frames = self.gameplay_screen.j_boost_frames
         else:
-            self.power_frames = gameplay_screen.invinc_frames
+            self.power_frames = self.gameplay_screen.invinc_frames
         self.surf = self.power_frames[0]
         self.last_update = 0
         self.current_frame = 0
@@ -475,7 +555,7 @@ class Powerup(Entity):
         self.update_rect()
 
     def update(self):
-        now = pygame.time.get_ticks()
+        now = self.game.sim_time * 1000
         if now - self.last_update > 150:
             self.last_update = now
             self.current_frame = (self.current_frame + 1) % len(self.power_frames)
@@ -485,9 +565,15 @@ class Powerup(Entity):
 
 class Pusher(Entity):
     def __init__(self, gameplay_screen, x, y, platform):
-        super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.pushers)
-        self.plat = platform
-        self.surf = gameplay_screen.pusher_walk_frames_l[1]
+        super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.objects,
+                         gameplay_screen.pushers)
+        self.spawn(x, y, platform)
+
+    def spawn(self, x, y, platform):
+        # Walking range along the platform. Kept rather than the platform itself, which may be killed and reused first.
+        self.min_x = platform.pos.x - platform.surf.get_width() // 2
+        self.max_x = platform.pos.x + platform.surf.get_width() // 2
+        self.surf = self.gameplay_screen.pusher_walk_frames_l[1]
         # self.surf = pygame.Surface((25, 25))
         # self.surf.fill((80, 80, 80))
         self.pos.x = x
@@ -501,7 +587,7 @@ class Pusher(Entity):
         self.update_rect()
 
     def animate(self):
-        now = pygame.time.get_ticks()
+        now = self.game.sim_time * 1000
         if now - self.last_update > 150:
             self.last_update = now
             if self.last_direction:
@@ -513,7 +599,7 @@ class Pusher(Entity):
 
     def update(self):
         old_pos_x = self.pos.x
-        if self.plat.pos.x - self.plat.surf.get_rect().center[0] < self.pos.x < self.plat.pos.x + self.plat.surf.get_rect().center[0]:
+        if self.min_x < self.pos.x < self.max_x:
             self.pos.x += self.vel
         else:
             self.vel *= -1
@@ -542,12 +628,10 @@ class Pusher(Entity):
 
 class Boss(Entity):
     def __init__(self, gameplay_screen, x, y, platform):
-        super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.bosses)
+        super().__init__(gameplay_screen, gameplay_screen.entities, gameplay_screen.objects,
+                         gameplay_screen.bosses)
         self.plat = platform
-        abs_dir = os.path.dirname(__file__)
-        self.boss_sprite = Spritesheet(os.path.join(abs_dir, 'assets/boss_sprite.png'))
-        self.boss_frame = self.boss_sprite.get_image(0, 0, 44, 88)
-        self.surf = self.boss_frame
+        self.surf = gameplay_screen.boss_frame
         # self.surf = pygame.Surface((32, 32))
         # self.surf.fill((255, 0, 0))
         self.pos.x = x
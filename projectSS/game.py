@@ -1,12 +1,22 @@
 import sys
 import os
-os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import time
+from collections import deque
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 import pygame
-import json
 from projectSS.menus import MainMenu, SettingsMenu, GameOverMenu, LevelCompleteMenu
 from projectSS.gameplayscreen import GameplayScreen
 from projectSS.minigame import MinigameScreen
+from projectSS.text import TextRenderer
+from projectSS.assetmanager import AssetManager
+from projectSS.atlas import Atlas
+from projectSS.dirtyrects import DirtyRectTracker
+from projectSS.scheduler import Scheduler
+from projectSS.controls import KeyboardControls, JUMP_KEYS
+from projectSS.replay import ReplayRecorder, ReplayControls
+from projectSS.persistence import UserDataStore, MemoryDataStore, user_data_dir
+from projectSS.runhistory import RunHistory
+from projectSS.music import MusicPlayer
 
 
 # --------------- In-code asset acknowledgement --------------- #
@@ -21,7 +31,14 @@ class Game:
     Shooting For The Stars game class. This class handles the entire functioning of the game by just initializing it.
     """
 
-    def __init__(self):
+    def __init__(self, run=True, history=True, persist=True):
+        """
+        :param run: False creates the game without starting the game loop. Used by the headless simulation.
+        :param history: False doesn't record runs in the run history. Used by the headless simulation.
+        :param persist: False keeps the user data in memory, starting from the defaults, instead of reading and saving
+            the player's save file. Used by the headless simulation.
+        """
+
         # --------------- Pygame initialization --------------- #
 
         pygame.init()
@@ -36,46 +53,70 @@ class Game:
 
         # --------------- Game assets --------------- #
 
-        #   * PLEASE use the below line of code to import assets! Without it, user installation will break!
+        #   * PLEASE register assets with the AssetManager below! Without it, user installation will break!
         #   * Most GUI images are 32x32.
         #   * GUI elements have a gradiant version named "light" that will replace it when the mouse hovers over it.
-        #   * This dictionary of assets DOES NOT handle background music (but does handle SFX blip)!
+        #   * The AssetManager DOES NOT handle background music (but does handle SFX blip)! Music is played by
+        #     self.music below, see projectSS/music.py.
+        #   * Assets are only loaded when first used. Screens preload their assets using the groups below.
+        #   * Large sounds, like the boss cues, are transient: the minigame drops them again when it ends.
+        #   * Sprite sheets and small images are packed into the texture atlas, see projectSS/atlas.py. They are
+        #     registered as "atlas" assets, by frame name. Rebuild the atlas after changing them!
         abs_dir = os.path.dirname(__file__)
-        self.__assets = {"icon": pygame.image.load(os.path.join(abs_dir, 'assets/musical_notes.png')),
-                         "btn_quit": pygame.image.load(os.path.join(abs_dir, 'assets/exit.png')),
-                         "btn_quit_light": pygame.image.load(os.path.join(abs_dir, 'assets/exit_light.png')),
-                         "btn_play": pygame.image.load(os.path.join(abs_dir, 'assets/play.png')),
-                         "btn_play_light": pygame.image.load(os.path.join(abs_dir, 'assets/play_light.png')),
-                         "btn_settings": pygame.image.load(os.path.join(abs_dir, 'assets/settings.png')),
-                         "btn_settings_light": pygame.image.load(os.path.join(abs_dir, "assets/settings_light.png")),
-                         "btn_minus": pygame.image.load(os.path.join(abs_dir, "assets/minus.png")),
-                         "btn_minus_light": pygame.image.load(os.path.join(abs_dir, "assets/minus-light.png")),
-                         "btn_plus": pygame.image.load(os.path.join(abs_dir, "assets/plus.png")),
-                         "btn_plus_light": pygame.image.load(os.path.join(abs_dir, "assets/plus_light.png")),
-                         "btn_retry": pygame.image.load(os.path.join(abs_dir, 'assets/retry.png')),
-                         "btn_retry_light": pygame.image.load(os.path.join(abs_dir, 'assets/retry_light.png')),
-                         "bg_main_menu": pygame.image.load(os.path.join(abs_dir, 'assets/mainbg.png')),
-                         "bg_game": pygame.image.load(os.path.join(abs_dir, 'assets/gamebg.png')),
-                         "font_loc": os.path.join(abs_dir, 'assets/playmegames.ttf'),
-                         "sfx_blip": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/blip.wav')),
-                         "minigame": pygame.image.load(os.path.join(abs_dir, 'assets/minigame.png')),
-                         "minigame_light": pygame.image.load(os.path.join(abs_dir, 'assets/minigame_light.png')),
-                         "bg_minigame": pygame.image.load(os.path.join(abs_dir, 'assets/minigame_bg.png')),
-                         "circle": pygame.image.load(os.path.join(abs_dir, 'assets/circle.png')),
-                         "sfx_hit": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/hit.wav')),
-                         "sfx_jump": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/jump.wav')),
-                         "sfx_pushed": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/pushed.wav')),
-                         "sfx_boostjump": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/boostjump.wav')),
-                         "sfx_loseshield": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/loseshield.wav')),
-                         "sfx_pickup": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/pickup.wav')),
-                         "enemy_disc": pygame.image.load(os.path.join(abs_dir, 'assets/disc.png')),
-                         "sfx_boss": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/boss_encounter.wav')),
-                         "sfx_boss_win": pygame.mixer.Sound(os.path.join(abs_dir, 'assets/boss_win.wav'))}
-
-        # SFX List.
-        self.sfx = [self.assets["sfx_blip"], self.assets["sfx_hit"], self.assets["sfx_jump"], self.assets["sfx_pushed"],
-                    self.assets["sfx_boostjump"], self.assets["sfx_loseshield"], self.assets["sfx_pickup"],
-                    self.assets["sfx_boss"], self.assets["sfx_boss_win"]]
+        self.atlas = Atlas.load(os.path.join(abs_dir, 'assets'))
+        self.__assets = AssetManager(abs_dir)
+        self.__assets.atlas = self.atlas
+        for name, kind, path in (("icon", "atlas", "musical_notes"),
+                                 ("btn_quit", "atlas", "exit"),
+                                 ("btn_quit_light", "atlas", "exit_light"),
+                                 ("btn_play", "atlas", "play"),
+                                 ("btn_play_light", "atlas", "play_light"),
+                                 ("btn_settings", "atlas", "settings"),
+                                 ("btn_settings_light", "atlas", "settings_light"),
+                                 ("btn_minus", "atlas", "minus"),
+                                 ("btn_minus_light", "atlas", "minus-light"),
+                                 ("btn_plus", "atlas", "plus"),
+                                 ("btn_plus_light", "atlas", "plus_light"),
+                                 ("btn_retry", "atlas", "retry"),
+                                 ("btn_retry_light", "atlas", "retry_light"),
+                                 ("bg_main_menu", "image", 'assets/mainbg.png'),
+                                 ("bg_game", "image", 'assets/gamebg.png'),
+                                 ("font_loc", "file", 'assets/playmegames.ttf'),
+                                 ("sfx_blip", "sound", 'assets/blip.wav'),
+                                 ("minigame", "atlas", "minigame"),
+                                 ("minigame_light", "atlas", "minigame_light"),
+                                 ("bg_minigame", "image", 'assets/minigame_bg.png'),
+                                 ("circle", "atlas", "circle"),
+                                 ("sfx_hit", "sound", 'assets/hit.wav'),
+                                 ("sfx_jump", "sound", 'assets/jump.wav'),
+                                 ("sfx_pushed", "sound", 'assets/pushed.wav'),
+                                 ("sfx_boostjump", "sound", 'assets/boostjump.wav'),
+                                 ("sfx_loseshield", "sound", 'assets/loseshield.wav'),
+                                 ("sfx_pickup", "sound", 'assets/pickup.wav'),
+                                 ("enemy_disc", "atlas", "disc"),
+                                 ("sfx_boss", "sound", 'assets/boss_encounter.wav'),
+                                 ("sfx_boss_win", "sound", 'assets/boss_win.wav')):
+            self.__assets.register(name, kind, path)
+
+        # Preload groups. "menus" is loaded at startup, the others when their screen is about to be used.
+        self.__assets.register_group("menus", ["icon", "font_loc", "sfx_blip", "bg_main_menu",
+                                               "btn_quit", "btn_quit_light", "btn_play", "btn_play_light",
+                                               "btn_settings", "btn_settings_light", "btn_minus", "btn_minus_light",
+                                               "btn_plus", "btn_plus_light", "btn_retry", "btn_retry_light"])
+        self.__assets.register_group("gameplay", ["bg_game", "enemy_disc", "sfx_hit", "sfx_jump", "sfx_pushed",
+                                                  "sfx_boostjump", "sfx_loseshield", "sfx_pickup"])
+        self.__assets.register_group("boss", ["sfx_boss", "bg_minigame", "circle", "sfx_boss_win"])
+        self.__assets.preload("menus")
+
+        # Background music. Screens preload the tracks they are likely to switch to.
+        self.music = MusicPlayer(abs_dir)
+
+        # Text rendering service. Keeps one font per size and caches rendered text surfaces.
+        self.text = TextRenderer(self.__assets["font_loc"])
+
+        # Dirty rectangle rendering. Screens that support it only redraw and update the regions that changed.
+        self.dirty_rendering = True
+        self.dirty_rects = DirtyRectTracker()
 
         # Window caption and icon.
         pygame.display.set_caption("Shooting For The Stars")
@@ -86,22 +127,40 @@ class Game:
         self.setting_sfx_volume = 0.8
         self.update_settings()
 
-        # Saving user data, level and high score
-        self.user_data = [0, 0]
-        if os.path.isfile(os.path.join(abs_dir, 'userData.json')) and os.access(os.path.join(abs_dir, 'userData.json'), os.R_OK):
-            f = open(os.path.join(abs_dir, 'userData.json'), "r")
-            self.user_data = json.load(f)
-            f.close()
+        # Saving user data, level and high score. Kept in memory and written to the user's data directory in the
+        # background, see projectSS/persistence.py. Older versions saved it in the game's directory.
+        if persist:
+            self.user_store = UserDataStore(os.path.join(user_data_dir(), 'userData.json'), [0, 0],
+                                            legacy_path=os.path.join(abs_dir, 'userData.json'))
         else:
-            f = open(os.path.join(abs_dir, 'userData.json'), "w")
-            f.write(json.dumps(self.user_data))
-            f.close()
+            self.user_store = MemoryDataStore([0, 0])
+        self.user_data = self.user_store.data
+
+        # Every finished run, for the best scores shown after a run. See projectSS/runhistory.py.
+        self.run_history = RunHistory(os.path.join(user_data_dir(), 'runs.sqlite3')) if history else None
+        self.run_level = None  # Level of the run in progress, None between runs
 
         # --------------- Game Logic --------------- #
 
+        # Timed transitions and audio cues. Runs callbacks without blocking the game loop.
+        self.scheduler = Scheduler()
+
+        # Player input, polled once per game logic step.
+        self.controls = KeyboardControls()
+
+        # Input replays. If record_path is set, the input of each run is recorded and saved there when the run ends.
+        # If playback is set to a Replay, the next run plays it back instead of reading the keyboard.
+        self.record_path = None
+        self.playback = None
+        self.last_replay = None  # Replay of the last recorded run
+
         # Stores the mouse position in a tuple. mouse_pos[0] accesses x, mouse_pos[1] accesses y.
         self.mouse_pos = pygame.mouse.get_pos()
         self.mouse_clicked = False
+        # Positions of the mouse clicks reported by the window events, waiting for a game logic step to handle them.
+        self.click_queue = deque()
+        # Game time at which a jump key went down, reported by the window events. Cleared by the next game logic step.
+        self.jump_press_time = None
 
         # Initialize game screens/menus. Game.update() handles switching between screens/menus.
         self.scrn_main_menu = MainMenu(self)
@@ -123,43 +182,91 @@ class Game:
         # Call upon the MainMenu's on_show() method to begin it's initialization.
         self.game_screen.on_show()
 
-        # Fixed FPS timer to maintain a smooth gaming experience.
+        # Fixed FPS timer to maintain a smooth gaming experience. Limits the render rate.
         self.FPS = 60
         self.FramePerSec = pygame.time.Clock()
 
+        # Fixed simulation timestep. Game logic always advances in steps of 1 / SIM_RATE seconds, no matter the render
+        # rate. Physics constants are tuned per step, so changing SIM_RATE changes the game's speed.
+        self.SIM_RATE = 60
+        self.MAX_SIM_STEPS = 5  # Most steps run in a single frame to catch up. Keeps slow frames from spiraling.
+        self.sim_accumulator = 0  # Time (s) not yet simulated.
+        self.frame_start = time.perf_counter()  # When the current frame's time was added to sim_accumulator.
+        self.sim_ticks = 0  # Number of game logic steps run so far. Game logic reads time from this, see sim_time.
+        # Fraction of a step between the last simulated state and the next one. Used to interpolate rendering.
+        self.alpha = 1.0
+
         # Begin to run the game.
-        self.game_loop()
+        if run:
+            self.game_loop()
 
     def game_loop(self):
         """
         As with any video game, Shooting For The Stars' loop is contained in a method. Each iteration of the loop is
-        considered a "tick" in the game. Each tick controls game FPS, logic, and rendering.
+        a frame. Each frame handles events, runs as many fixed game logic steps ("ticks") as the elapsed time calls
+        for, and renders once.
         """
 
+        step = 1 / self.SIM_RATE
         while self.running:
             # Limit FPS to fixed value.
-            self.FramePerSec.tick(self.FPS)
-            self.update()
+            self.sim_accumulator += self.FramePerSec.tick(self.FPS) / 1000
+            self.frame_start = time.perf_counter()
+            self.handle_events()
+
+            steps = 0
+            while self.sim_accumulator >= step and steps < self.MAX_SIM_STEPS:
+                self.update()
+                self.sim_accumulator -= step
+                steps += 1
+
+            # Drop the time that couldn't be caught up on.
+            if self.sim_accumulator >= step:
+                self.sim_accumulator %= step
+
+            # Nothing moves while a transition is blocking the game screen, so draw the last state as is.
+            self.alpha = 1.0 if self.scheduler.blocking else self.sim_accumulator / step
             self.render()
 
-    def update(self):
+    def handle_events(self):
         """
-        This function, which is called in each iteration of Game.game_loop(), ensures that game logic progresses.
+        Handles window events. Called once per frame in Game.game_loop(), before the game logic steps.
         """
 
-        # Update mouse position. Reset mouse_clicked boolean from any previous mouse clicks.
-        self.mouse_pos = pygame.mouse.get_pos()
-        self.mouse_clicked = False
-
-        # Event handling
         for event in pygame.event.get():
             # If X button of window is clicked the game is exited
             if event.type == pygame.QUIT:
-                sys.exit()
+                self.quit()
 
-            # If user clicked the mouse, update the corresponding boolean.
+            # Queue mouse clicks where they were made. The controls hand them to the game logic one per step.
             if event.type == pygame.MOUSEBUTTONDOWN:
-                self.mouse_clicked = True
+                self.click_queue.append(event.pos)
+
+            # Remember when a jump key press was read, so the jump is judged against the beat at that time instead of
+            # at the time of the step that handles it. The game logic has simulated up to sim_time, the accumulated
+            # time runs up to the start of the frame. pygame's events carry no timestamp, so the press can't be
+            # placed more precisely than the frame it was read in.
+            if event.type == pygame.KEYDOWN and event.key in JUMP_KEYS and self.jump_press_time is None:
+                self.jump_press_time = (self.sim_time + self.sim_accumulator
+                                        + time.perf_counter() - self.frame_start)
+
+    def update(self):
+        """
+        This function is one fixed step of game logic, called by Game.game_loop() SIM_RATE times per second.
+        """
+
+        self.sim_ticks += 1
+
+        # Update player input and mouse state.
+        self.controls.poll(self)
+        # Only the step right after the press may use it, whatever controls are in use.
+        self.jump_press_time = None
+        self.mouse_clicked = self.controls.click
+        self.mouse_pos = self.controls.mouse_pos
+
+        # Run any scheduled callbacks that are due. Timed in game logic steps, so transitions last as long in
+        # simulated time as they do when playing.
+        self.scheduler.update(self.sim_time * 1000)
 
         # Change game screen if necessary.
         if self.next_game_screen is not None:
@@ -167,12 +274,14 @@ class Game:
             self.game_screen = self.next_game_screen
             self.next_game_screen = None
 
+            # The new screen has to be drawn completely on its first frame.
+            self.game_screen.invalidate()
+
             if self.prev_game_screen == self.scrn_minigame_screen:
                 if not self.scrn_minigame_screen.minigame_mode:
-                    # Reload music and reset rhythm mechanic timer.
-                    pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), self.scrn_gameplay_screen.music_file))
-                    pygame.mixer.music.play(-1)
-                    self.scrn_gameplay_screen.rhy_start_time = time.time()
+                    # Resume the music and the rhythm mechanic where the boss encounter stopped them.
+                    self.music.play(self.scrn_gameplay_screen.music_file, resume=True)
+                    self.scrn_gameplay_screen.song_clock.resume(self.sim_time)
                 else:
                     self.game_screen.on_show()
             elif self.prev_game_screen == self.scrn_settings_menu and self.game_screen == self.scrn_gameplay_screen:
@@ -181,17 +290,31 @@ class Game:
                 self.game_screen.on_show()  # Call on the new game_screen to initialize itself.
 
         # Call on the current game_screen's update() method to allow it to progress its game logic.
-        self.game_screen.update()
+        # Skipped while a transition is waiting on the scheduler, e.g. for a sound cue to finish.
+        if not self.scheduler.blocking:
+            self.game_screen.update()
+
+        # Mouse clicks are only handled by one step.
+        self.mouse_clicked = False
 
     def render(self):
         """
         This method handles rendering to the screen by resetting it, calling on the current game_screen's respective
         render() method, and updating the screen. Called in each iteration of Game.game_loop().
+
+        If dirty rendering is enabled and the current game_screen supports it, the screen isn't reset and only the
+        regions reported by the game_screen are updated.
         """
 
-        self.screen.fill((0, 0, 0))
-        self.game_screen.render()
-        pygame.display.update()
+        if self.dirty_rendering and self.game_screen.dirty_rects_supported:
+            self.game_screen.render()
+            self.dirty_rects.flush()
+        else:
+            self.game_screen.invalidate()
+            self.screen.fill((0, 0, 0))
+            self.game_screen.render()
+            pygame.display.update()
+            self.dirty_rects.clear()
 
     def draw_text(self, text, size, x, y):
         """
@@ -201,17 +324,75 @@ class Game:
         :param size: The desired size of the text.
         :param x: The x position of the screen where text will be displayed.
         :param y: The y position of the screen where text will be displayed.
+        :return: The region of the screen that was drawn to.
         """
-        font = pygame.font.Font(self.__assets["font_loc"], size)
-        text_surface = font.render(text, True, (0, 0, 0))
+        text_surface = self.text.render(text, size)
         text_rect = text_surface.get_rect()
         text_rect.center = (x, y)
-        self.screen.blit(text_surface, text_rect)
+        return self.screen.blit(text_surface, text_rect)
+
+    # --------------- Replay recording and playback --------------- #
+
+    def start_run(self):
+        """
+        Called by GameplayScreen when a new run starts, after the run has been seeded. Restarts the simulated time and
+        starts recording or playing back the run's input. Input is recorded from the next game logic step on.
+        """
+        self.end_run()
+
+        # Every run starts at the same simulated time, so a replay plays out the same no matter when it is started.
+        self.sim_ticks = 0
+        self.scheduler.clear()
+        self.run_level = self.gameplay.level
+
+        if self.playback is not None:
+            self.controls = ReplayControls(self.playback)
+            self.playback = None
+            self.click_queue.clear()
+        elif self.record_path is not None:
+            self.controls = ReplayRecorder(self.controls, self.gameplay.level, self.gameplay.seed, self.SIM_RATE)
+
+    def end_run(self):
+        """
+        Stops recording or playing back input when a run ends, saving the recording if there is one.
+        """
+        if isinstance(self.controls, ReplayRecorder):
+            self.last_replay = self.controls.replay
+            self.last_replay.save(self.record_path)
+            self.controls = self.controls.source
+        elif isinstance(self.controls, ReplayControls):
+            # Clicks made while the replay played were never handled.
+            self.controls = KeyboardControls()
+            self.click_queue.clear()
+
+    def record_run(self, outcome):
+        """
+        Adds the run that just ended to the run history. Only the first call after a run started records it.
+
+        :param outcome: RunHistory.DIED, COMPLETED or QUIT.
+        """
+        if self.run_level is None:
+            return
+        if self.run_history is not None:
+            gameplay = self.gameplay
+            self.run_history.record(self.run_level, gameplay.seed, gameplay.best_distance, gameplay.times_hit,
+                                    self.sim_time, outcome)
+        self.run_level = None
+
+    def quit(self):
+        """
+        Exits the game. A run in progress is recorded as quit, and its recording is saved.
+        """
+        self.record_run(RunHistory.QUIT)
+        self.end_run()
+        sys.exit()
 
     # --------------- Methods used by the current game screen to change to a different game screen --------------- #
 
     def show_main_menu_screen(self):
         self.next_game_screen = self.scrn_main_menu
+        self.record_run(RunHistory.QUIT)
+        self.end_run()
         self.save_user_data()
 
     def show_settings_screen(self):
@@ -231,11 +412,15 @@ class Game:
         self.scrn_gameover_menu.score = int(self.scrn_gameplay_screen.best_distance)
         self.scrn_gameover_menu.endless = self.scrn_gameplay_screen.endless
         self.scrn_gameover_menu.highscore = int(self.scrn_gameplay_screen.high_score)
+        self.record_run(RunHistory.DIED)
+        self.end_run()
         self.save_user_data()
         self.next_game_screen = self.scrn_gameover_menu
     
     def show_level_complete_screen(self):
         self.next_game_screen = self.scrn_level_complete_menu
+        self.record_run(RunHistory.COMPLETED)
+        self.end_run()
         self.save_user_data()
     
     def show_minigame_screen(self):
@@ -260,17 +445,24 @@ class Game:
         # Modify the music's volume. Pygame represents music volume with values between 0 - 1, hence the 0.1 value.
         pygame.mixer.music.set_volume(self.setting_music_volume * 0.1)
 
-        # Modify all of the stored SFXs' volumes.
-        for s in self.sfx:
-            s.set_volume(self.setting_sfx_volume * 0.5)
+        # Modify all of the SFXs' volumes, including the ones that haven't been loaded yet.
+        self.__assets.set_sound_volume(self.setting_sfx_volume * 0.5)
 
     def save_user_data(self):
-        abs_dir = os.path.dirname(__file__)
+        """
+        Saves the highest level and high score. Returns right away, the data is written in the background.
+        """
         self.user_data[0] = self.gameplay.highest_level
         self.user_data[1] = self.gameplay.high_score
-        f = open(os.path.join(abs_dir, 'userData.json'), "w")
-        f.write(json.dumps(self.user_data))
-        f.close()
+        self.user_store.save(self.user_data)
+
+    @property
+    def sim_time(self):
+        """
+        Simulated time in seconds. Advances by exactly 1 / SIM_RATE per game logic step, so game logic that reads it
+        behaves the same at any render rate, in the headless simulation and when playing back a replay.
+        """
+        return self.sim_ticks / self.SIM_RATE
 
     @property
     def assets(self):
@@ -1,9 +1,15 @@
 import os
+import random
 import pygame.math
 from projectSS.gamescreen import GameScreen
 from projectSS.menus import Button
 from projectSS.entities import *
 from projectSS.spritesheet import *
+from projectSS.spatial import BandedGroup
+from projectSS.pool import EntityPool
+from projectSS.hazards import HazardArrays
+from projectSS.clock import SongClock, BeatGrid
+from projectSS.beatmap import load_beatmap, preload_beatmaps
 
 
 class GameplayScreen(GameScreen):
@@ -16,6 +22,8 @@ class GameplayScreen(GameScreen):
     * render() will draw all assets in their current state to the screen.
     """
 
+    dirty_rects_supported = True
+
     def __init__(self, game):
 
         super().__init__(game)  # Binds the Game object to variable self.game.
@@ -35,23 +43,59 @@ class GameplayScreen(GameScreen):
         # --------------- Entities Lists --------------- #
 
         # These lists allow for easy sprite access.
+        # The groups the player collides with are indexed by height, so collision checks only test nearby entities.
         self.entities = pygame.sprite.Group()  # Master list, since all inherit from Entities class.
-        self.platforms = pygame.sprite.Group()  # Used in player update() method.
-        self.powerups = pygame.sprite.Group()
-        self.enemies = pygame.sprite.Group()
-        self.pushers = pygame.sprite.Group()
-        self.bosses = pygame.sprite.Group()
+        # Entities updated one by one, all of them unless the NumPy backend simulates the enemies and platforms.
+        self.objects = pygame.sprite.Group()
+        self.platforms = BandedGroup()  # Used in player update() method.
+        self.powerups = BandedGroup()
+        self.enemies = BandedGroup()
+        self.pushers = BandedGroup()
+        self.bosses = BandedGroup()
+
+        # Killed platforms, enemies, powerups and pushers are kept here and reused by spawn().
+        self.pools = {cls: EntityPool(cls) for cls in (Platform, Enemy, Powerup, Pusher)}
+        # Platform surfaces by (width, color), shared by every platform of that size and color.
+        self.plat_surfaces = {}
+        # Enemy sprite, scaled once when the gameplay assets are loaded.
+        self.enemy_frame = None
+
+        # Optional NumPy simulation backend for enemies and platforms, see projectSS/hazards.py. Set soa_backend to use
+        # it from the next run on. hazards is the backend of the current run, None when it isn't used.
+        self.soa_backend = False
+        self.hazards = None
+        # Stress testing: number of extra enemies spread over the level at the start of each run.
+        self.stress_hazards = 0
+        self.STRESS_HEIGHT = 12000  # Height above the start the extra enemies are spread over
 
         self.boss_spawned = False
         self.boss_platform_space = 0
 
         self.camera_y = 0
+        # Camera position at the start of the current game logic step, and the interpolated one used for rendering.
+        self.prev_camera_y = 0
+        self.render_camera_y = 0
+        # Regions of the screen drawn to in the previous frame. Restored with the background in the next frame.
+        self.prev_rects = []
+        # Entities further than this outside the camera's view aren't drawn.
+        self.CULL_MARGIN = 16
+        # Number of entities drawn and skipped in the last frame, shown in debug mode.
+        self.drawn_count = 0
+        self.culled_count = 0
         # Despawn point for entities. Anything below this y-limit gets destroyed.
         self.despawn_y = 0
 
         # Creation of player character.
         self.player = Player(self)
 
+        # --------------- Level Seed --------------- #
+
+        # All randomness of a run (level generation, pushers, minigame) comes from this generator, seeded at the start
+        # of each run. The same seed and the same inputs produce the same run.
+        self.rng = random.Random()
+        self.seed = None  # Seed of the current run
+        self.next_seed = None  # Seed to use for the next run instead of a random one. Used once.
+
         # --------------- Platform Generation Variables and Constants --------------- #
 
         # Non-constant variables here can be changed with difficulty
@@ -66,8 +110,12 @@ class GameplayScreen(GameScreen):
 
         # --------------- Rhythm-Based Mechanic --------------- #
 
+        # Music track of each level, the last one is endless mode
+        self.LEVEL_MUSIC = ('assets/BlipStream.mp3', 'assets/8bitmusic.mp3', 'assets/retrofunk.mp3',
+                            'assets/retrofunk.mp3')
         # Music file
-        self.music_file = 'assets/retrofunk.mp3'
+        self.music_file = self.LEVEL_MUSIC[2]
+        preload_beatmaps(*(os.path.join(os.path.dirname(__file__), track) for track in self.LEVEL_MUSIC))
 
         # Rhythm timing variables
         self.rhy_bpm = 165  # Music BPM
@@ -81,7 +129,15 @@ class GameplayScreen(GameScreen):
         # Smaller values mean a shorter beat time and harder rhythm timing
         self.rhy_beat_threshold = 0.5
         self.rhy_on_beat = False
-        self.rhy_start_time = 0
+        # Beat timeline of the current level's track, built from the variables above when the level starts.
+        self.beat_grid = None
+        # Position in the song, read once per step by update_beat(). Everything moving with the beat uses song_time.
+        self.song_clock = SongClock(self.game.music)
+        self.song_time = 0
+        # Follow the music's playback position instead of the game clock. The game loop drops the time it can't catch
+        # up on after a hitch, so the game clock falls behind the music for good. Not used when recording or playing
+        # back replays, which need the rhythm to be reproducible.
+        self.rhy_sync_to_music = True
 
         # --------------- Distance and Score --------------- #
 
@@ -99,6 +155,10 @@ class GameplayScreen(GameScreen):
         self.times_hit = 0
         self.goal = False
 
+        # Rendered score text. Only re-rendered when the rounded score changes.
+        self.score_value = None
+        self.score_surf = None
+
         # Variables for enemy generation, each 500 dist roll a 1/10 chance to generate a new enemy
         self.enemy_dist = 0
         self.rand_dist = 0
@@ -121,9 +181,8 @@ class GameplayScreen(GameScreen):
 
         # --------------- Powerup Sprites --------------- #
 
-        abs_dir = os.path.dirname(__file__)
-        self.jump_boost = Spritesheet(os.path.join(abs_dir, 'assets/jumpboost_flashr.png'))
-        self.invincibility = Spritesheet(os.path.join(abs_dir, 'assets/invinc_spritesheetre.png'))
+        self.jump_boost = Spritesheet.from_atlas(self.game.atlas, 'jumpboost_flashr')
+        self.invincibility = Spritesheet.from_atlas(self.game.atlas, 'invinc_spritesheetre')
         self.j_boost_frames = [self.jump_boost.get_image(0, 0, 64, 64),
                                self.jump_boost.get_image(64, 0, 64, 64)]
         self.invinc_frames = [self.invincibility.get_image(0, 0, 64, 64),
@@ -131,7 +190,7 @@ class GameplayScreen(GameScreen):
 
         # --------------- Pusher Sprite ----------------- #
 
-        self.pusher_sprite = Spritesheet(os.path.join(abs_dir, 'assets/pusherspritesheetr.png'))
+        self.pusher_sprite = Spritesheet.from_atlas(self.game.atlas, 'pusherspritesheetr')
         self.pusher_walk_frames_l = [self.pusher_sprite.get_image(0, 0, 60, 66),
                                      self.pusher_sprite.get_image(0, 66, 60, 66)]
         self.pusher_walk_frames_r = [self.pusher_sprite.get_image(60, 0, 60, 66),
@@ -139,6 +198,11 @@ class GameplayScreen(GameScreen):
         self.pusher_thrust = [self.pusher_sprite.get_image(0, 132, 60, 66),
                               self.pusher_sprite.get_image(60, 132, 60, 66)]
 
+        # --------------- Boss Sprite ----------------- #
+
+        # Fetched here so spawning a boss in the middle of a run doesn't load anything.
+        self.boss_frame = Spritesheet.from_atlas(self.game.atlas, 'boss_sprite').get_image(0, 0, 44, 88)
+
         # --------------- Pause Screen ------------------ #
 
         self.paused = False
@@ -166,7 +230,7 @@ class GameplayScreen(GameScreen):
             self.plat_color = (255, 128, 0)
 
             # Music / Rhythm
-            self.music_file = 'assets/BlipStream.mp3'
+            self.music_file = self.LEVEL_MUSIC[0]
             self.rhy_bpm = 150
             self.rhy_offset = 0.24  # Time (s) to first beat
             self.rhy_beat_divisions = 0.5  # Adjust divisions of beat (2, 4 = faster, 0.5, 0.25 = slower)
@@ -197,7 +261,7 @@ class GameplayScreen(GameScreen):
             self.plat_color = (255, 128, 0)
 
             # Music / Rhythm
-            self.music_file = 'assets/8bitmusic.mp3'
+            self.music_file = self.LEVEL_MUSIC[1]
             self.rhy_bpm = 97
             self.rhy_offset = 0.132  # Time (s) to first beat
             self.rhy_beat_divisions = 1  # Adjust divisions of beat (2, 4 = faster, 0.5, 0.25 = slower)
@@ -228,7 +292,7 @@ class GameplayScreen(GameScreen):
             self.plat_color = (255, 128, 0)
 
             # Music / Rhythm
-            self.music_file = 'assets/retrofunk.mp3'
+            self.music_file = self.LEVEL_MUSIC[2]
             self.rhy_bpm = 165
             self.rhy_offset = 0.120  # Time (s) to first beat
             self.rhy_beat_divisions = 1  # Adjust divisions of beat (2, 4 = faster, 0.5, 0.25 = slower)
@@ -255,7 +319,7 @@ class GameplayScreen(GameScreen):
             self.endless = True
 
             # Music / Rhythm
-            self.music_file = 'assets/retrofunk.mp3'
+            self.music_file = self.LEVEL_MUSIC[3]
             self.rhy_bpm = 165
             self.rhy_offset = 0.120  # Time (s) to first beat
             self.rhy_beat_divisions = 1  # Adjust divisions of beat (2, 4 = faster, 0.5, 0.25 = slower)
@@ -286,6 +350,7 @@ class GameplayScreen(GameScreen):
 
         # Reset variables.
         self.camera_y = -self.game.HEIGHT + 10
+        self.prev_camera_y = self.camera_y
         self.despawn_y = self.camera_y + self.game.HEIGHT + 32
         self.best_distance = 0
         self.enemy_dist = 0
@@ -300,24 +365,98 @@ class GameplayScreen(GameScreen):
         # Set up variables for individual levels
         self.set_level_variables()
 
+        # Seed the run.
+        if self.next_seed is not None:
+            self.seed = self.next_seed
+            self.next_seed = None
+        else:
+            self.seed = random.randrange(2 ** 32)
+        self.rng.seed(self.seed)
+
+        # Start recording or playing back the run's input.
+        self.game.start_run()
+
+        # Load gameplay assets now rather than on first use in the middle of the level.
+        self.game.assets.preload("gameplay")
+        if self.enemy_frame is None:
+            self.enemy_frame = pygame.transform.scale(self.game.assets["enemy_disc"], (35, 35))
+
         # Reset player character.
         self.player.reset()
 
         # Kill all entities that may have been left over from previous game.
         for e in self.entities:
             e.kill()
+        self.hazards = HazardArrays() if self.soa_backend else None
 
         # Add base platform.
-        base_platform = Platform(self, self.game.WIDTH, self.game.WIDTH / 2, 0, (255, 0, 0))
+        base_platform = self.spawn(Platform, self.game.WIDTH, self.game.WIDTH / 2, 0, (255, 0, 0))
         self.debug_platform = None
 
         # Call the platform generator method to add additional platforms above the base platform.
         self.gen_platforms(True)
 
+        # Stress testing hazards.
+        for i in range(self.stress_hazards):
+            self.spawn(Enemy,
+                       self.rng.randrange(self.game.WIDTH // 6, self.game.WIDTH // 4),
+                       self.rng.randrange(0, self.game.WIDTH // 2),
+                       self.camera_y - 15 - self.rng.randrange(self.STRESS_HEIGHT))
+
+        # Use the track's analyzed beat map if there is one, see projectSS.beatmap.
+        music_path = os.path.join(os.path.dirname(__file__), self.music_file)
+        beatmap = load_beatmap(music_path)
+        if beatmap is not None:
+            self.rhy_bpm = beatmap["bpm"]
+            self.rhy_offset = beatmap["offset"]
+
         # Reset the background music and start the rhythm mechanic timer.
-        pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), self.music_file))
-        pygame.mixer.music.play(-1)
-        self.rhy_start_time = time.time()
+        self.beat_grid = BeatGrid(self.rhy_bpm, self.rhy_offset, self.rhy_beat_divisions, self.rhy_beat_threshold)
+        self.song_clock.sync_to_music = self.rhy_sync_to_music and self.game.playback is None \
+            and self.game.record_path is None
+        self.game.music.play(self.music_file)
+        self.song_clock.start(self.game.sim_time)
+        # Tracks of the screens this one can switch to: boss minigame, game over, level complete.
+        self.game.music.preload('assets/minigame_bgm.mp3', 'assets/gameover_bgm.mp3', 'assets/victory.mp3')
+
+    def spawn(self, cls, *args):
+        """
+        Creates a pooled entity, reusing a killed one of the same type if there is one.
+
+        :param cls: Platform, Enemy, Powerup or Pusher.
+        :param args: Constructor arguments of the entity, without the GameplayScreen.
+        :return: The spawned entity.
+        """
+        return self.pools[cls].acquire(self, *args)
+
+    def platform_surfaces(self, width, color):
+        """
+        Returns the outer and inner surface of a platform, drawing them on first use.
+
+        :param width: Width of the platform.
+        :param color: RGB color of the platform's border.
+        :return: Tuple of (outer surface, inner surface).
+        """
+        key = (width, color)
+        surfaces = self.plat_surfaces.get(key)
+        if surfaces is None:
+            surf = pygame.Surface((width, 20))
+            surf.fill(color)
+            surf_inner = pygame.Surface((width - 8, 12))
+            surf_inner.fill((32, 32, 32))
+            surfaces = (surf, surf_inner)
+            self.plat_surfaces[key] = surfaces
+        return surfaces
+
+    def allocation_stats(self):
+        """
+        Returns how many pooled entities were spawned, and how many of them had to be allocated.
+
+        :return: Tuple of (spawned, allocated).
+        """
+        created = sum(pool.created for pool in self.pools.values())
+        reused = sum(pool.reused for pool in self.pools.values())
+        return created + reused, created
 
     def gen_platforms(self, whole_screen=False):
         """
@@ -332,19 +471,19 @@ class GameplayScreen(GameScreen):
         # For i in range number of platforms missing from required number of platforms.
         for i in range(self.plat_count - len(self.platforms)):
             # Set width/position.
-            width = random.randrange(self.plat_width_min, self.plat_width_max)
+            width = self.rng.randrange(self.plat_width_min, self.plat_width_max)
             x = None
 
             # Generate platforms on the entire screen.
             if whole_screen:
                 # Space platforms equally, then add a random offset
                 y = self.camera_y + i * (self.game.HEIGHT / self.plat_count) \
-                    + random.randrange(-self.PLAT_VERTICAL_OFFSET, self.PLAT_VERTICAL_OFFSET)
+                    + self.rng.randrange(-self.PLAT_VERTICAL_OFFSET, self.PLAT_VERTICAL_OFFSET)
 
             # Dynamically generator platforms during gameplay.
             elif not self.goal:
                 # Generate platforms at the top of the screen, just offscreen.
-                y = self.camera_y - random.randrange(self.PLAT_MIN_VERTICAL_GAP, self.plat_max_vertical_gap)
+                y = self.camera_y - self.rng.randrange(self.PLAT_MIN_VERTICAL_GAP, self.plat_max_vertical_gap)
                 # If the last platform is boss-platform, add extra vertical space to next platform.
                 if self.boss_platform_space != 0:
                     y += self.boss_platform_space
@@ -367,14 +506,14 @@ class GameplayScreen(GameScreen):
 
                     # Generate x with minimum gap
                     if gap_left > 0:
-                        x_left = self.PLAT_MIN_SCREEN_GAP + int(width / 2) + random.randrange(gap_left)
+                        x_left = self.PLAT_MIN_SCREEN_GAP + int(width / 2) + self.rng.randrange(gap_left)
 
                     if gap_right > 0:
-                        x_right = self.game.WIDTH - self.PLAT_MIN_SCREEN_GAP - int(width / 2) - random.randrange(
+                        x_right = self.game.WIDTH - self.PLAT_MIN_SCREEN_GAP - int(width / 2) - self.rng.randrange(
                             gap_right)
 
                     if gap_left > 0 and gap_right > 0:
-                        if random.randrange(gap_left + gap_right) < gap_left:
+                        if self.rng.randrange(gap_left + gap_right) < gap_left:
                             x = x_left
                         else:
                             x = x_right
@@ -385,28 +524,30 @@ class GameplayScreen(GameScreen):
 
             # Default random x value.
             if x is None:
-                x = random.randrange(self.PLAT_MIN_SCREEN_GAP + int(width / 2),
+                x = self.rng.randrange(self.PLAT_MIN_SCREEN_GAP + int(width / 2),
                                      self.game.WIDTH - (self.PLAT_MIN_SCREEN_GAP + int(width / 2)))
 
             # Create platform with the calculated x and y values.
             # If we haven't spawned a boss for this level and we are at half progress, spawn boss-platform
             if not self.boss_spawned and self.progress >= self.distance_requirement / 2:
-                plat = Platform(self, self.game.WIDTH - 200, self.game.WIDTH / 2, y, self.plat_color)
+                # Load the boss encounter assets before the player can reach the boss.
+                self.game.assets.preload("boss")
+                plat = self.spawn(Platform, self.game.WIDTH - 200, self.game.WIDTH / 2, y, self.plat_color)
                 Boss(self, plat.pos.x, y - 52, plat)
                 self.boss_platform_space = -100
                 self.boss_spawned = True
                 continue
             else:
-                plat = Platform(self, width, x, y, self.plat_color)
+                plat = self.spawn(Platform, width, x, y, self.plat_color)
 
             # --------------- Powerups and Pusher Spawning --------------- #
 
-            if random.randrange(100) < self.pwr_jump_chance:
-                Powerup(self, x, y - 25, 'boost')
-            elif random.randrange(100) < self.pwr_shield_chance:
-                Powerup(self, x, y - 25, 'invincible')
-            elif random.randrange(100) < self.enm_pusher_chance:
-                Pusher(self, x, y - 36, plat)
+            if self.rng.randrange(100) < self.pwr_jump_chance:
+                self.spawn(Powerup, x, y - 25, 'boost')
+            elif self.rng.randrange(100) < self.pwr_shield_chance:
+                self.spawn(Powerup, x, y - 25, 'invincible')
+            elif self.rng.randrange(100) < self.enm_pusher_chance:
+                self.spawn(Pusher, x, y - 36, plat)
 
     def gen_enemies(self):
         """
@@ -417,15 +558,15 @@ class GameplayScreen(GameScreen):
         # enemy generation algorithm 300 to 1200 spaces after 1000, maximum is lowered by 100 every 1000
         if self.progress > self.enm_spawn_dist and len(self.enemies) < 3:
             if self.rand_dist == 0:
-                self.rand_dist = random.randrange(self.enm_min_dist, max(self.enm_max_dist,
+                self.rand_dist = self.rng.randrange(self.enm_min_dist, max(self.enm_max_dist,
                                                                          self.enm_max_dist_start - 100 * (
                                                                                  self.progress - 1000) // 1000))
                 self.enemy_dist = self.progress
             if self.progress - self.enemy_dist > self.rand_dist:
-                Enemy(self,
-                      random.randrange(self.game.WIDTH // 6, self.game.WIDTH // 4),  # Platform span
-                      random.randrange(0, self.game.WIDTH // 2),  # Platform x
-                      self.camera_y - 15)
+                self.spawn(Enemy,
+                           self.rng.randrange(self.game.WIDTH // 6, self.game.WIDTH // 4),  # Platform span
+                           self.rng.randrange(0, self.game.WIDTH // 2),  # Platform x
+                           self.camera_y - 15)
                 self.rand_dist = 0
 
     def gen_goal(self):
@@ -434,30 +575,32 @@ class GameplayScreen(GameScreen):
         """
 
         self.goal = True
-        Platform(self, self.game.WIDTH, self.game.WIDTH / 2, self.camera_y - 150, (255, 215, 0), True)
+        self.spawn(Platform, self.game.WIDTH, self.game.WIDTH / 2, self.camera_y - 150, (255, 215, 0), True)
 
     def update_beat(self):
         """
         This method handles the rhythm mechanic and updating the corresponding variables based on timer.
         """
 
-        # Current time.
-        cur_time = time.time() - (self.rhy_start_time + self.rhy_offset)
+        # Current position in the song, the same for everything updated in this step.
+        self.song_time = self.song_clock.time(self.game.sim_time)
 
-        # Get time between beats.
-        beat_time = 60 / (self.rhy_bpm * self.rhy_beat_divisions)
+        # Get previous and next beat times, and time to closest beat.
+        self.rhy_prev_beat, self.rhy_next_beat, self.rhy_closest_beat_time = self.beat_grid.lookup(self.song_time)
 
-        # Get previous and next beat times.
-        self.rhy_prev_beat = int(cur_time / beat_time) * beat_time
-        self.rhy_next_beat = int((cur_time + beat_time) / beat_time) * beat_time
+        # On beat?
+        self.rhy_on_beat = self.rhy_closest_beat_time <= self.beat_grid.window
 
-        # Get time to closest beat.
-        prev_beat_time = cur_time - self.rhy_prev_beat
-        next_beat_time = self.rhy_next_beat - cur_time
-        self.rhy_closest_beat_time = prev_beat_time if prev_beat_time < next_beat_time else next_beat_time
+    def on_beat_at(self, offset):
+        """
+        Judges an input against the beat grid at the time it happened.
 
-        # On beat?
-        self.rhy_on_beat = self.rhy_closest_beat_time <= beat_time * (self.rhy_beat_threshold / 2)
+        :param offset: Time of the input in seconds, relative to the current step. None judges it at the step itself.
+        :return: True if the input was on beat.
+        """
+        if offset is None:
+            return self.rhy_on_beat
+        return self.beat_grid.lookup(self.song_time + offset)[2] <= self.beat_grid.window
 
     # All game logic and their changes go in this method
     def update(self):
@@ -466,18 +609,39 @@ class GameplayScreen(GameScreen):
         handles the GameplayScreen's logic and updates its variables when needed.
         """
 
-        pressed_keys = pygame.key.get_pressed()
-        if pressed_keys[K_p] or pressed_keys[K_ESCAPE]:
+        if self.game.controls.pause:
             if not self.pause_key_pressed:
                 self.paused = not self.paused
                 self.pause_key_pressed = True
+                # The pause screen covers the whole window, so it is drawn and cleared with a full redraw.
+                self.redraw = True
+                # The song and the rhythm stop while paused.
+                if self.paused:
+                    self.game.music.pause()
+                    self.song_clock.pause(self.game.sim_time)
+                else:
+                    self.game.music.unpause()
+                    self.song_clock.resume(self.game.sim_time)
         else:
             self.pause_key_pressed = False
 
+        # Save positions from the previous step, used to interpolate rendering between steps.
+        self.prev_camera_y = self.camera_y
+        for e in self.objects:
+            e.save_position()
+        if self.hazards is not None:
+            self.hazards.save_positions()
+        self.player.save_position()
+
         self.update_buttons()  # Update all UI buttons for user interaction.
         if not self.paused:
             self.update_beat()  # Update rhythm mechanic variables.
-            self.entities.update()  # Call the update method of all entities.
+            if self.hazards is not None:
+                # Enemies and platforms in the NumPy backend, in one pass. Only the ones that could reach the screen
+                # in this step are copied back to their sprites.
+                self.hazards.update(self.song_time, self.rhy_bpm * self.rhy_beat_divisions, self.despawn_y,
+                                    self.camera_y - self.game.HEIGHT / 4)
+            self.objects.update()  # Call the update method of all entities.
             self.player.update()  # Update the player character.
 
             # Debug mode
@@ -494,11 +658,12 @@ class GameplayScreen(GameScreen):
                 # Create debug platform
                 if self.debug and self.debug_platform is None:
                     self.highest_level = 3
-                    self.debug_platform = Platform(self, self.game.WIDTH, self.game.WIDTH / 2, 0, (128, 0, 255))
+                    self.debug_platform = self.spawn(Platform, self.game.WIDTH, self.game.WIDTH / 2, 0, (128, 0, 255))
 
                 # Delete debug platform
                 if not self.debug and self.debug_platform is not None:
                     self.debug_platform.kill()
+                    self.debug_platform = None
 
                 # Keep debug platform at screen edge
                 if self.debug_platform is not None:
@@ -528,7 +693,7 @@ class GameplayScreen(GameScreen):
                 self.game.show_level_complete_screen()
 
             # allows for screen to scroll up and destroy.
-            if self.player.rect_render.top <= self.game.HEIGHT / 4:
+            if self.player.rect.top - self.camera_y <= self.game.HEIGHT / 4:
                 self.camera_y = self.player.rect.top - self.game.HEIGHT / 4
 
                 # Don't move camera too far above completion height
@@ -553,41 +718,106 @@ class GameplayScreen(GameScreen):
         """
         This method handles drawing to the screen all visual aspects of the game. Called in iteration of Game's
         game_loop() method.
+
+        Unless the whole screen has to be redrawn, only the regions drawn to in the previous frame are cleared, and
+        only those and the regions drawn to in this frame are reported to game.dirty_rects.
         """
 
-        # Draw background image.
-        self.game.screen.blit(self.game.assets["bg_game"], (0, 0))
+        # Camera position between the last two game logic steps.
+        self.render_camera_y = self.prev_camera_y + (self.camera_y - self.prev_camera_y) * self.game.alpha
+
+        background = self.game.assets["bg_game"]
+        # The pause screen is translucent, so it always needs a fresh background below it.
+        full_redraw = self.redraw or self.paused
+        self.redraw = False
+
+        # Draw background image, or clear what was drawn in the previous frame.
+        if full_redraw:
+            self.game.screen.blit(background, (0, 0))
+        else:
+            for rect in self.prev_rects:
+                self.game.screen.blit(background, rect, rect)
+
+        drawn = []
 
-        # Call on all entities to draw themselves to the screen.
+        # Call on all entities in view to draw themselves to the screen. The view is computed once per frame, in world
+        # coordinates, so entities outside it don't even update their screen position.
+        view_top = self.render_camera_y - self.CULL_MARGIN
+        view_bottom = self.render_camera_y + self.game.HEIGHT + self.CULL_MARGIN
+        culled = 0
         for e in self.entities:
-            e.render()
+            rect = e.rect
+            if rect.bottom < view_top or rect.top > view_bottom:
+                culled += 1
+            else:
+                drawn.append(e.render())
+        self.drawn_count = len(drawn)
+        self.culled_count = culled
 
         # Call on player to draw itself.
-        self.player.render()
+        drawn.append(self.player.render())
 
         # Draw all buttons using this helper method.
-        self.render_buttons()
+        drawn.extend(self.render_buttons())
 
         # Draw progress bar using this helper method.
         if self.level < 3:
-            self.draw_progress()
+            drawn.append(self.draw_progress())
 
         # Draws pause screen
         if self.paused:
             self.draw_pause_screen()
 
         # Draw current score
-        self.game.draw_text(str(round(self.progress)), 30, self.game.WIDTH / 2, 50 if not self.endless else 20)
+        drawn.append(self.draw_score())
+
+        # Draw culling statistics
+        if self.debug:
+            drawn.append(self.game.draw_text('drawn %d culled %d' % (self.drawn_count, self.culled_count), 16,
+                                             self.game.WIDTH / 2, self.game.HEIGHT - 16))
+            music = self.game.music.latency_stats()
+            drawn.append(self.game.draw_text('music %d/%d preloaded, max %.1f ms'
+                                             % (music["preloaded"], music["plays"], music["max"] * 1000), 16,
+                                             self.game.WIDTH / 2, self.game.HEIGHT - 32))
+            resident, transient = self.game.assets.audio_memory()
+            drawn.append(self.game.draw_text('sounds %.1f MB resident, %.1f MB transient'
+                                             % (resident / 1e6, transient / 1e6), 16,
+                                             self.game.WIDTH / 2, self.game.HEIGHT - 48))
+
+        if full_redraw:
+            self.game.dirty_rects.invalidate()
+        else:
+            self.game.dirty_rects.add_all(self.prev_rects)
+            self.game.dirty_rects.add_all(drawn)
+        self.prev_rects = drawn
 
     def draw_progress(self):
         """
         This method draws the progress bar that fills up as the player progresses.
+
+        :return: The region of the screen that was drawn to.
         """
         pygame.draw.rect(self.game.screen, (76, 187, 23), (self.game.WIDTH / 3 + 2, 12,
                                                            min(self.game.WIDTH / 3 * (
                                                                    self.progress / self.distance_requirement),
                                                                self.game.WIDTH / 3 - 2), 16), 0, 5, 5, 5, 5)
-        pygame.draw.rect(self.game.screen, (0, 0, 0), (self.game.WIDTH / 3, 10, self.game.WIDTH / 3, 20), 3, 5, 5, 5, 5)
+        return pygame.draw.rect(self.game.screen, (0, 0, 0), (self.game.WIDTH / 3, 10, self.game.WIDTH / 3, 20),
+                                3, 5, 5, 5, 5)
+
+    def draw_score(self):
+        """
+        This method draws the current score. The score text is only re-rendered when its value changes.
+
+        :return: The region of the screen that was drawn to.
+        """
+        score = round(self.progress)
+        if score != self.score_value:
+            self.score_value = score
+            self.score_surf = self.game.text.render(str(score), 30, cache=False)
+
+        score_rect = self.score_surf.get_rect()
+        score_rect.center = (self.game.WIDTH / 2, 50 if not self.endless else 20)
+        return self.game.screen.blit(self.score_surf, score_rect)
 
     def draw_pause_screen(self):
         """
@@ -607,7 +837,8 @@ class GameplayScreen(GameScreen):
     def render_buttons(self):
         """
         This method invokes all buttons to draw themselves to the screen.
+
+        :return: List of the regions of the screen that were drawn to.
         """
 
-        for btn in self.buttons:
-            btn.render()
+        return [btn.render() for btn in self.buttons]
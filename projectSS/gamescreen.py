@@ -4,8 +4,16 @@ from abc import ABC, abstractmethod
 # Abstract game screen class with update and draw function.
 # Menu screens and the main gameplay screen should inherit from this class.
 class GameScreen(ABC):
+	# True if render() only redraws what changed and reports the changed regions to game.dirty_rects.
+	dirty_rects_supported = False
+
 	def __init__(self, game):
 		self.game = game
+		self.redraw = True  # Tells render() to draw the whole screen on the next frame.
+
+	# Forces the whole screen to be drawn on the next frame
+	def invalidate(self):
+		self.redraw = True
 
 	# Called when this screen is shown
 	def on_show(self):
@@ -0,0 +1,134 @@
+import math
+
+# NumPy is optional. Without it, enemies and platforms are simulated as separate objects.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class HazardArrays:
+    """
+    Struct-of-arrays simulation backend for enemies and platforms. Positions, enemy movement parameters and despawn
+    checks live in NumPy arrays and are updated in one vectorized pass per game logic step, so a level can hold
+    thousands of moving hazards.
+
+    The Enemy and Platform sprites stay in their groups as thin views for rendering and collision, but not in
+    GameplayScreen.objects, so they aren't updated one by one. Only the ones close to the camera get their position
+    and rect copied from the arrays each step, the player can't reach the others.
+    Produces the same runs as the object backend, replays can be played back with either one.
+    """
+
+    PLATFORM = 0
+    ENEMY = 1
+
+    def __init__(self, capacity=64):
+        """
+        :param capacity: Initial number of slots. Grows as needed.
+        """
+        if numpy is None:
+            raise RuntimeError("The NumPy simulation backend needs NumPy, install it with: pip install numpy")
+
+        self.x = numpy.zeros(capacity)
+        self.y = numpy.zeros(capacity)
+        self.start = numpy.zeros(capacity)  # Enemies: left end of the movement
+        self.span = numpy.zeros(capacity)  # Enemies: half the movement width
+        self.kind = numpy.zeros(capacity, numpy.int8)
+        self.active = numpy.zeros(capacity, bool)
+        self.synced = numpy.zeros(capacity, bool)  # Sprite was updated from the arrays in the last step
+
+        self.entities = [None] * capacity  # Sprite of each slot
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.entities) - len(self.free)
+
+    def grow(self):
+        """
+        Doubles the number of slots.
+        """
+        capacity = len(self.entities)
+        for name in ("x", "y", "start", "span", "kind", "active", "synced"):
+            array = getattr(self, name)
+            grown = numpy.zeros(capacity * 2, array.dtype)
+            grown[:capacity] = array
+            setattr(self, name, grown)
+        self.entities.extend([None] * capacity)
+        self.free.extend(range(capacity * 2 - 1, capacity - 1, -1))
+
+    def add(self, entity, kind, start=0.0, span=0.0):
+        """
+        Assigns a slot to a spawned entity. Sets entity.slot.
+
+        :param kind: HazardArrays.PLATFORM or HazardArrays.ENEMY.
+        :param start: Enemy movement start, see Enemy.
+        :param span: Enemy movement span, see Enemy.
+        """
+        if not self.free:
+            self.grow()
+        slot = self.free.pop()
+        self.x[slot] = entity.pos.x
+        self.y[slot] = entity.pos.y
+        self.start[slot] = start
+        self.span[slot] = span
+        self.kind[slot] = kind
+        self.active[slot] = True
+        self.synced[slot] = False
+        self.entities[slot] = entity
+        entity.slot = slot
+
+    def remove(self, entity):
+        """
+        Frees the slot of a killed entity.
+        """
+        slot = entity.slot
+        self.active[slot] = False
+        self.synced[slot] = False
+        self.entities[slot] = None
+        self.free.append(slot)
+        entity.slot = None
+
+    def place(self, entity):
+        """
+        Copies the position of an entity that was moved by other code into the arrays.
+        """
+        self.x[entity.slot] = entity.pos.x
+        self.y[entity.slot] = entity.pos.y
+
+    def save_positions(self):
+        """
+        Saves the positions of the sprites kept up to date by update(), see Entity.save_position().
+        """
+        entities = self.entities
+        for slot in numpy.flatnonzero(self.synced):
+            entities[slot].save_position()
+
+    def update(self, song_time, beat_speed, despawn_y, sync_top):
+        """
+        Advances every enemy and platform by one game logic step.
+
+        :param song_time: Position in the song in seconds, see GameplayScreen.song_time.
+        :param beat_speed: rhy_bpm * rhy_beat_divisions, the enemies move with the beat.
+        :param despawn_y: Entities below this are killed.
+        :param sync_top: Enemies above this aren't copied back to their sprite.
+        """
+        # Same sine wave oscillation as Enemy.update(). Every enemy is at the same phase.
+        wave = math.sin(song_time * beat_speed / 120 * math.pi)
+        enemies = self.active & (self.kind == self.ENEMY)
+        numpy.add(self.start, self.span * wave + self.span, out=self.x, where=enemies)
+
+        for slot in numpy.flatnonzero(self.active & (self.y > despawn_y)):
+            self.entities[slot].kill()
+
+        # Copy positions to the sprites the player could touch or that are about to be drawn.
+        synced = self.active & (self.kind == self.ENEMY) & (self.y >= sync_top)
+        x = self.x
+        entities = self.entities
+        for slot in numpy.flatnonzero(synced & ~self.synced):
+            # Its previous position is stale, don't interpolate from it.
+            entities[slot].prev_pos = None
+        for slot in numpy.flatnonzero(synced):
+            entity = entities[slot]
+            entity.pos.x = x[slot]
+            entity.update_rect()
+        self.synced = synced
@@ -0,0 +1,237 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+# SDL has to be told to use its dummy drivers before pygame initializes the display and mixer.
+os.environ['SDL_VIDEODRIVER'] = "dummy"
+os.environ['SDL_AUDIODRIVER'] = "dummy"
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
+
+from projectSS.game import Game
+from projectSS.controls import ScriptedControls
+from projectSS.replay import Replay
+from projectSS import hazards
+
+
+# --------------- Input policies --------------- #
+#
+#   A policy is a function taking a random.Random and returning a script for ScriptedControls, a function from the
+#   step number to a (left, right, jump, pause) tuple.
+
+def idle_policy(rng):
+    return lambda tick: (False, False, False, False)
+
+
+def jump_policy(rng):
+    return lambda tick: (False, False, True, False)
+
+
+def random_policy(rng):
+    """
+    Holds a random left/right direction and taps jump, changing direction every 10 to 60 steps.
+    """
+    state = {"until": 0, "left": False, "right": False}
+
+    def script(tick):
+        if tick >= state["until"]:
+            direction = rng.randrange(3)
+            state["left"] = direction == 0
+            state["right"] = direction == 1
+            state["until"] = tick + rng.randrange(10, 60)
+        return state["left"], state["right"], tick % 30 < 20, False
+
+    return script
+
+
+POLICIES = {"idle": idle_policy, "jump": jump_policy, "random": random_policy}
+
+
+class HeadlessRunner:
+    """
+    Runs GameplayScreen without a window, audio device or frame cap. Game logic steps run back to back, with input
+    coming from a policy instead of the keyboard. Used for level tuning and regression testing of the platform and
+    enemy generation.
+    """
+
+    def __init__(self, level=0, policy="random", boss_result="lose", max_ticks=36000, seed=0, replay=None,
+                 record_path=None, trace_memory=False, soa_backend=False, stress_hazards=0):
+        """
+        :param level: Level to play, 0 to 2, 3 for endless mode.
+        :param policy: Name of the input policy, see POLICIES.
+        :param boss_result: "win" or "lose". Outcome of the boss minigame, which isn't simulated.
+        :param max_ticks: Maximum number of game logic steps per run.
+        :param seed: Level seed of the first run. Each following run uses the next seed. Also seeds the input policy.
+        :param replay: Replay to play back instead of using the policy. Level, seed and minigames come from the replay.
+        :param record_path: If set, the input of each run is recorded and saved to this file.
+        :param trace_memory: Measures the memory allocated during each game logic step with tracemalloc. Much slower.
+        :param soa_backend: Simulates enemies and platforms with the NumPy backend.
+        :param stress_hazards: Number of extra enemies spread over the level, for stress testing.
+        """
+        self.level = level
+        self.policy = POLICIES[policy]
+        self.boss_result = boss_result
+        self.max_ticks = max_ticks
+        self.seed = seed
+        self.replay = replay
+        self.trace_memory = trace_memory
+
+        self.game = Game(run=False, history=False, persist=False)
+        self.game.record_path = record_path
+        self.game.scrn_gameplay_screen.soa_backend = soa_backend
+        self.game.scrn_gameplay_screen.stress_hazards = stress_hazards
+        # Game logic runs much faster than the music plays.
+        self.game.scrn_gameplay_screen.rhy_sync_to_music = False
+
+    def run(self):
+        """
+        Plays a single run until the player dies, completes the level or max_ticks is reached.
+
+        :return: Dictionary of run statistics.
+        """
+        game = self.game
+        gameplay = game.scrn_gameplay_screen
+        minigame = game.scrn_minigame_screen
+
+        seed = self.seed
+        level = self.level
+        max_ticks = self.max_ticks
+        self.seed += 1
+        if self.replay is not None:
+            seed = self.replay.seed
+            level = self.replay.level
+            # One more step than recorded, for the step that starts the run.
+            max_ticks = self.replay.ticks + 1
+            game.playback = self.replay
+
+        game.controls = ScriptedControls(self.policy(random.Random(seed)))
+        game.scheduler.clear()
+        gameplay.level = level
+        gameplay.next_seed = seed
+        game.next_game_screen = gameplay
+
+        spawned_before, allocated_before = gameplay.allocation_stats()
+        outcome = "timeout"
+        bosses = 0
+        ticks = 0
+        allocated_bytes = 0
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        while ticks < max_ticks:
+            if self.trace_memory:
+                before = tracemalloc.get_traced_memory()[0]
+                if hasattr(tracemalloc, "reset_peak"):
+                    # Memory allocated during the step, whether it is freed again or not.
+                    tracemalloc.reset_peak()
+                    game.update()
+                    allocated_bytes += tracemalloc.get_traced_memory()[1] - before
+                else:
+                    # Python 3.8 can't reset the peak, only count the memory the step kept allocated.
+                    game.update()
+                    allocated_bytes += max(tracemalloc.get_traced_memory()[0] - before, 0)
+            else:
+                game.update()
+            ticks += 1
+
+            if game.game_screen is minigame and minigame.result_lines is None and self.replay is None:
+                # Skip the minigame itself and play out its result. Replays play the minigame with the recorded clicks.
+                bosses += 1
+                if self.boss_result == "win":
+                    minigame.reward(game.show_gameplay_screen)
+                else:
+                    minigame.punishment(game.show_gameplay_screen)
+
+            if game.next_game_screen is game.scrn_gameover_menu:
+                outcome = "died"
+                break
+            if game.next_game_screen is game.scrn_level_complete_menu:
+                outcome = "won"
+                break
+        elapsed = time.perf_counter() - start
+        if self.trace_memory:
+            tracemalloc.stop()
+        spawned, allocated = gameplay.allocation_stats()
+        sim_seconds = ticks / game.SIM_RATE
+
+        # Back to a neutral screen for the next run.
+        game.end_run()
+        game.next_game_screen = None
+        game.game_screen = game.scrn_main_menu
+
+        return {"seed": seed,
+                "outcome": outcome,
+                "ticks": ticks,
+                "seconds": elapsed,
+                "ticks_per_second": ticks / elapsed if elapsed > 0 else float('inf'),
+                "distance": int(gameplay.best_distance),
+                "times_hit": gameplay.times_hit,
+                "bosses": bosses,
+                # Entities spawned and entities allocated per second of game time. Without pooling both would be equal.
+                "spawn_rate": (spawned - spawned_before) / sim_seconds if sim_seconds > 0 else 0,
+                "allocation_rate": (allocated - allocated_before) / sim_seconds if sim_seconds > 0 else 0,
+                # Peak memory allocated per game logic step, only measured with trace_memory.
+                "bytes_per_tick": allocated_bytes / ticks if ticks > 0 else 0}
+
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got %s" % text)
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless max-speed simulation of Shooting For The Stars.")
+    parser.add_argument("--level", type=int, default=0, help="level to play, 0-2, or 3 for endless mode")
+    parser.add_argument("--runs", type=positive_int, default=10, help="number of runs")
+    parser.add_argument("--ticks", type=int, default=36000, help="maximum game logic steps per run")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random", help="input policy")
+    parser.add_argument("--boss", choices=("win", "lose"), default="lose", help="outcome of boss minigames")
+    parser.add_argument("--seed", type=int, default=0, help="level seed of the first run")
+    parser.add_argument("--replay", metavar="FILE", help="play back a recorded run as fast as possible")
+    parser.add_argument("--record", metavar="FILE", help="record the input of the runs, FILE keeps the last one")
+    parser.add_argument("--tracemalloc", action="store_true", help="measure memory allocated per game logic step")
+    parser.add_argument("--backend", choices=("objects", "numpy"), default="objects",
+                        help="simulate enemies and platforms as separate objects, or in NumPy arrays")
+    parser.add_argument("--stress", type=int, default=0, metavar="N", help="spread N extra enemies over the level")
+    args = parser.parse_args(argv)
+
+    if args.backend == "numpy" and hazards.numpy is None:
+        parser.error("the numpy backend needs NumPy, install it with: pip install numpy")
+
+    replay = Replay.load(args.replay) if args.replay is not None else None
+    runner = HeadlessRunner(args.level, args.policy, args.boss, args.ticks, args.seed, replay, args.record,
+                            args.tracemalloc, args.backend == "numpy", args.stress)
+    if replay is not None and replay.sim_rate != runner.game.SIM_RATE:
+        parser.error("the replay was recorded at %d game logic steps per second, the game runs %d"
+                     % (replay.sim_rate, runner.game.SIM_RATE))
+    results = []
+    for _ in range(args.runs):
+        result = runner.run()
+        results.append(result)
+        print("seed %d: %s after %d ticks (%.0f ticks/s), distance %d, hit %d times, %d bosses"
+              % (result["seed"], result["outcome"], result["ticks"], result["ticks_per_second"], result["distance"],
+                 result["times_hit"], result["bosses"]))
+
+    total_ticks = sum(r["ticks"] for r in results)
+    total_seconds = sum(r["seconds"] for r in results)
+    outcomes = {}
+    for r in results:
+        outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+    print("%d runs, %d ticks in %.2f s (%.0f ticks/s)" % (len(results), total_ticks, total_seconds,
+                                                          total_ticks / total_seconds if total_seconds > 0 else 0))
+    print("outcomes: " + ", ".join("%s %d" % item for item in sorted(outcomes.items())))
+    print("average distance: %d" % (sum(r["distance"] for r in results) / len(results)))
+    print("entities per game second: %.1f spawned, %.1f allocated"
+          % (sum(r["spawn_rate"] for r in results) / len(results),
+             sum(r["allocation_rate"] for r in results) / len(results)))
+    if args.tracemalloc:
+        print("memory allocated per tick: %.0f bytes" % (sum(r["bytes_per_tick"] for r in results) / len(results)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
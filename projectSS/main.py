@@ -1,8 +1,30 @@
+import argparse
 from projectSS.game import Game
+from projectSS.replay import Replay
 
 
-def main():
-    Game()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shooting For The Stars")
+    parser.add_argument("--record", metavar="FILE", help="record the input of each run to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="play back a run recorded with --record")
+    args = parser.parse_args(argv)
+
+    if args.replay is None and args.record is None:
+        Game()
+        return
+
+    game = Game(run=False)
+    game.record_path = args.record
+    if args.replay is not None:
+        replay = Replay.load(args.replay)
+        if replay.sim_rate != game.SIM_RATE:
+            parser.error("the replay was recorded at %d game logic steps per second, the game runs %d"
+                         % (replay.sim_rate, game.SIM_RATE))
+        game.playback = replay
+        game.gameplay.level = replay.level
+        game.gameplay.next_seed = replay.seed
+        game.next_game_screen = game.gameplay
+    game.game_loop()
 
 
 if __name__ == "__main__":
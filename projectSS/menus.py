@@ -1,5 +1,4 @@
 import pygame
-import os.path
 import sys
 from abc import ABC
 
@@ -21,6 +20,8 @@ class Button:
 
         # True if mouse is hovering over button
         self.mouse_hover = False
+        # Hover state the button was last drawn with. Used by menus to only redraw buttons that changed.
+        self.rendered_hover = None
 
     def update(self):
         # Update mouse over
@@ -33,24 +34,84 @@ class Button:
             self.on_click()
 
     def render(self):
-        self.game.screen.blit(self.sprite_hover if self.mouse_hover else self.sprite, (self.x, self.y))
+        self.rendered_hover = self.mouse_hover
+        return self.game.screen.blit(self.sprite_hover if self.mouse_hover else self.sprite, (self.x, self.y))
 
 
 # menu base class for handling multiple menus
+# Menus only redraw buttons whose hover state changed, the rest of the menu is redrawn after a click.
 class Menu(GameScreen, ABC):
+    dirty_rects_supported = True
+
     def __init__(self, game):
         super().__init__(game)
         self.center_x, self.center_y = self.game.WIDTH / 2, self.game.HEIGHT / 2
         self.buttons = []
+        self.background = "bg_main_menu"  # Asset name of the menu background
+        # Best scores of a level from the run history, see request_top_scores().
+        self.top_scores = None
+        self.top_scores_future = None
+
+    # Buttons currently shown on the menu
+    def visible_buttons(self):
+        return self.buttons
 
     def update_buttons(self):
-        for btn in self.buttons:
+        for btn in self.visible_buttons():
             btn.update()
 
+        # A click can change the text of the menu
+        if self.game.mouse_clicked:
+            self.invalidate()
+
     def render_buttons(self):
-        for btn in self.buttons:
+        for btn in self.visible_buttons():
             btn.render()
 
+    # Asks the run history for the best scores of a level. They are shown once the answer arrives.
+    def request_top_scores(self, level):
+        self.top_scores = None
+        self.top_scores_future = None
+        if self.game.run_history is not None:
+            self.top_scores_future = self.game.run_history.top_scores(level)
+
+    # Picks up the best scores without waiting for them. Called every step.
+    def update_top_scores(self):
+        future = self.top_scores_future
+        if future is not None and future.done():
+            self.top_scores_future = None
+            if future.exception() is None:
+                self.top_scores = future.result()
+                self.invalidate()
+
+    def render_top_scores(self, y):
+        if self.top_scores:
+            self.game.draw_text('Best Scores', 30, self.center_x, y)
+            for i, (score, _, _) in enumerate(self.top_scores):
+                self.game.draw_text('%d. %d' % (i + 1, score), 20, self.center_x, y + 32 + i * 24)
+
+    # Draws the menu's text on top of the background
+    def render_text(self):
+        pass
+
+    def update(self):
+        self.update_buttons()
+
+    def render(self):
+        background = self.game.assets[self.background]
+        if self.redraw:
+            self.redraw = False
+            self.game.screen.blit(background, (0, 0))
+            self.render_text()
+            self.render_buttons()
+            self.game.dirty_rects.invalidate()
+        else:
+            for btn in self.visible_buttons():
+                if btn.mouse_hover != btn.rendered_hover:
+                    area = pygame.Rect(btn.x, btn.y, btn.width, btn.height)
+                    self.game.screen.blit(background, area, area)
+                    self.game.dirty_rects.add(btn.render())
+
 
 class MainMenu(Menu):
     def __init__(self, game):
@@ -91,16 +152,10 @@ class MainMenu(Menu):
 
     def on_show(self):
         if self.game.prev_game_screen != self.game.scrn_settings_menu:
-            pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), 'assets/8bitmusic.mp3'))
-            pygame.mixer.music.play(-1)
-
-    def update(self):
-        self.update_buttons()
-
-    def render(self):
-        # Draws the background using the image
-        self.game.screen.blit(self.game.assets["bg_main_menu"], (0, 0))
+            self.game.music.play('assets/8bitmusic.mp3')
+        self.game.music.preload(self.game.gameplay.LEVEL_MUSIC[self.game.gameplay.level])
 
+    def render_text(self):
         # Title text
         self.game.draw_text('Shooting for the Stars', 40, self.center_x, self.center_y - 40)
         if self.game.gameplay.level > self.game.gameplay.highest_level:
@@ -109,15 +164,16 @@ class MainMenu(Menu):
         else:
             self.game.draw_text(str(self.game.gameplay.level+1) if self.game.gameplay.level < 3 else "Endless", 30,
                                 self.center_x-15, self.center_y + 110)
-        self.render_buttons()
 
     def level_minus(self):
         if self.game.gameplay.level > 0:
             self.game.gameplay.level -= 1
+            self.game.music.preload(self.game.gameplay.LEVEL_MUSIC[self.game.gameplay.level])
 
     def level_plus(self):
         if self.game.gameplay.level < 3:
             self.game.gameplay.level += 1
+            self.game.music.preload(self.game.gameplay.LEVEL_MUSIC[self.game.gameplay.level])
 
 
 class SettingsMenu(Menu):
@@ -150,13 +206,7 @@ class SettingsMenu(Menu):
         self.buttons.append(self.btn_sfx_minus)
         self.buttons.append(self.btn_sfx_plus)
 
-    def update(self):
-        self.update_buttons()
-
-    def render(self):
-        # Draws the background using the image
-        self.game.screen.blit(self.game.assets["bg_main_menu"], (0, 0))
-
+    def render_text(self):
         self.game.draw_text('Options', 50, self.center_x, self.center_y - 192)
 
         self.game.draw_text('Music Volume', 30, self.center_x, self.center_y - 96)
@@ -165,8 +215,6 @@ class SettingsMenu(Menu):
         self.game.draw_text('SFX Volume', 30, self.center_x, self.center_y + 32)
         self.game.draw_text(str(int(self.game.setting_sfx_volume * 10)), 30, self.center_x, self.center_y + 80)
 
-        self.render_buttons()
-
     def music_minus(self):
         self.game.setting_music_volume -= 0.1
         self.game.update_settings()
@@ -190,6 +238,7 @@ class GameOverMenu(Menu):
         self.score = score
         self.endless = endless
         self.highscore = highscore
+        self.background = "bg_game"
 
         self.btn_retry = Button(self.center_x - 48, self.center_y + 30,
                                 self.game.assets["btn_retry"], self.game.assets["btn_retry_light"],
@@ -204,17 +253,16 @@ class GameOverMenu(Menu):
 
     def on_show(self):
         # bgm source: https://thewhitepianokey.bandcamp.com/track/leaving-yoshi-slow-loopable
-        pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), 'assets/gameover_bgm.mp3'))
-        pygame.mixer.music.play(-1)
+        self.game.music.play('assets/gameover_bgm.mp3')
+        # Retry or back to the main menu.
+        self.game.music.preload(self.game.gameplay.music_file, 'assets/8bitmusic.mp3')
+        self.request_top_scores(self.game.gameplay.level)
 
     def update(self):
-        self.update_buttons()
-
-    def render(self):
-        # Draws the background using the image
-        self.game.screen.blit(self.game.assets["bg_game"], (0, 0))
+        super().update()
+        self.update_top_scores()
 
-        # Text
+    def render_text(self):
         if self.endless and self.highscore == self.score:
             self.game.draw_text('High Score!', 40, self.center_x, self.center_y - 40)
         elif self.endless:
@@ -223,14 +271,14 @@ class GameOverMenu(Menu):
         else:
             self.game.draw_text('Game Over', 40, self.center_x, self.center_y - 40)
         self.game.draw_text('Score: ' + str(self.score), 30, self.center_x, self.center_y - 80)
-
-        self.render_buttons()
+        self.render_top_scores(self.center_y + 110)
 
 
 class LevelCompleteMenu(Menu):
     def __init__(self, game, gameplay_screen):
         super().__init__(game)
         self.gameplay_screen = gameplay_screen
+        self.background = "bg_game"
 
         self.btn_continue = Button(self.center_x - 48, self.center_y + 30,
                                    self.game.assets["btn_play"], self.game.assets["btn_play_light"],
@@ -243,28 +291,26 @@ class LevelCompleteMenu(Menu):
         self.buttons.append(self.btn_quit)
 
     def on_show(self):
-        pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), 'assets/victory.mp3'))
-        pygame.mixer.music.play(-1)
+        self.game.music.play('assets/victory.mp3')
+        # Next level or back to the main menu.
+        self.game.music.preload(self.gameplay_screen.LEVEL_MUSIC[min(self.gameplay_screen.level, 3)],
+                                'assets/8bitmusic.mp3')
+        # The level was already advanced to the next one.
+        self.request_top_scores(self.gameplay_screen.level - 1)
 
     def update(self):
+        super().update()
+        self.update_top_scores()
+
+    def visible_buttons(self):
         # Don't add continue button after level 3
         if self.gameplay_screen.level < 3:
-            self.btn_continue.update()
-        
-        self.btn_quit.update()
-
-    def render(self):
-        # Draws the background using the image
-        self.game.screen.blit(self.game.assets["bg_game"], (0, 0))
+            return self.buttons
+        return [self.btn_quit]
 
-        # Text
+    def render_text(self):
         self.game.draw_text('Level %d Complete!' % self.gameplay_screen.level, 40, self.center_x, self.center_y - 40)
         self.game.draw_text('Score: ' + str(int(self.gameplay_screen.best_distance)), 30, self.center_x, self.center_y - 80)
+        self.render_top_scores(self.center_y + 110)
         if self.gameplay_screen.level > 2:
             self.game.draw_text('Endless Mode Unlocked', 30, self.center_x, self.center_y - 120)
-
-        # Don't add continue button after level 3
-        if self.gameplay_screen.level < 3:
-            self.btn_continue.render()
-
-        self.btn_quit.render()
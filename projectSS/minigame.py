@@ -1,30 +1,33 @@
-import os
-import random
-import time
-from math import sqrt
 import pygame
+import pygame.gfxdraw
 from projectSS.gamescreen import GameScreen
-
-
-class ClickedTooLate(Exception):
-    """
-    A custom-made exception used if the player did not click on the minigame rings in time.
-    """
-
-    def __init__(self, message="Didn't click the minigame button in time"):
-        self.message = message
+from projectSS.spatial import poisson_disk_sample
 
 
 class Ring(pygame.sprite.Sprite):
     """
     The class that represents the ring objects that appear in the minigame.
+
+    A ring is a small state machine. It starts out SHRINKING: its outer circle closes in on the ring, one step at a
+    time. Clicking it while the outer circle is between HIT_MIN_RADIUS and HIT_MAX_RADIUS makes it HIT. If the outer
+    circle shrinks past HIT_MIN_RADIUS first, it is MISSED. update() and click() return the state as their result.
     """
 
-    def __init__(self, x, y, sprite, game):
+    # States
+    SHRINKING = 0
+    HIT = 1
+    MISSED = 2
+
+    # Outer circle radius range in which the ring can be hit.
+    HIT_MIN_RADIUS = 52
+    HIT_MAX_RADIUS = 72
+
+    def __init__(self, x, y, sprite, outlines, game):
         super().__init__()
         self.x = x
         self.y = y
         self.sprite = sprite
+        self.outlines = outlines  # RingOutlines the outer circle is drawn with
         self.game = game
 
         self.width = sprite.get_width()
@@ -33,47 +36,128 @@ class Ring(pygame.sprite.Sprite):
         self.outer_radius = 200  # Outer ring. Decreases in size during gameplay. Can be changed.
         self.outer_radius_delta = -1.75  # The change over time of the outer_radius ring. Can be changed.
 
-        self.mouse_hover = False  # Boolean used in mouse detection.
+        self.state = Ring.SHRINKING
 
     def update(self):
         """
-        The individual ring update method. Handles user interaction, outer ring size, and clicking timing.
-        """
-        # Checks if mouse is hovering over the sprite using the sprite's position and size.
-        self.mouse_hover = (self.x <= self.game.mouse_pos[0] < self.x + self.width and
-                            self.y <= self.game.mouse_pos[1] < self.y + self.height)
+        Shrinks the outer circle by one step, or misses the ring if it got too small.
 
-        # Player is hovering over ring, has clicked on it, and the outer ring is the correct size.
-        if self.mouse_hover and self.game.mouse_clicked and 52 <= self.outer_radius <= 72:
-            self.game.assets["sfx_blip"].play()
-            return True
-        else:
-            # Player has clicked on the ring too late. Exception is raised and handled in MinigameScreen.update().
-            if self.outer_radius < 52:
-                raise ClickedTooLate
+        :return: The ring's state.
+        """
+        if self.state == Ring.SHRINKING:
+            if self.outer_radius < Ring.HIT_MIN_RADIUS:
+                self.state = Ring.MISSED
             else:
                 self.outer_radius += self.outer_radius_delta
+        return self.state
 
-    def render(self):
-        """
-        The individual ring render method. Draws the ring sprite and the outer circle.
+    def contains(self, x, y):
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+    def click(self):
         """
-        self.game.screen.blit(self.sprite, (self.x, self.y))
-        pygame.draw.circle(self.game.screen, (134, 144, 250), (self.x + 64, self.y + 64), self.outer_radius, width=3)
+        Called when the ring was clicked. Hits the ring if the outer circle is the correct size.
 
-    def center(self):
+        :return: The ring's state.
         """
-        Helper method. Calculates the ring's center coordinates. Used in MinigameScreen.on_show() in collision detect.
+        if self.state == Ring.SHRINKING and Ring.HIT_MIN_RADIUS <= self.outer_radius <= Ring.HIT_MAX_RADIUS:
+            self.state = Ring.HIT
+            self.game.assets["sfx_blip"].play()
+        return self.state
 
-        :return: (ring_x, ring_y)
+    def render(self):
         """
-        return self.x + self.width, self.y + self.height
+        The individual ring render method. Draws the ring sprite and the outer circle.
+        """
+        screen = self.game.screen
+        screen.blit(self.sprite, (self.x, self.y))
+        outline = self.outlines.get(self.outer_radius)
+        half = outline.get_width() // 2
+        screen.blit(outline, (self.x + self.width / 2 - half, self.y + self.height / 2 - half))
 
     @property
     def radius(self):
         return self.inner_radius
 
 
+class RingOutlines:
+    """
+    Anti-aliased outer circles of the rings, rendered once per radius and shared by all rings. Radii are rounded to
+    whole pixels. The circles are RLE accelerated, so blitting one skips over its transparent inside.
+    """
+
+    def __init__(self, color=(134, 144, 250), width=3):
+        """
+        :param color: Color of the circles.
+        :param width: Line width of the circles in pixels.
+        """
+        self.color = color
+        self.width = width
+        self.surfaces = {}  # Rendered circles by radius
+
+    def get(self, radius):
+        """
+        :return: Surface with the circle of the given radius centered on it.
+        """
+        radius = round(radius)
+        surface = self.surfaces.get(radius)
+        if surface is None:
+            surface = self.render(radius)
+            self.surfaces[radius] = surface
+        return surface
+
+    def render(self, radius):
+        center = radius + 1
+        surface = pygame.Surface((2 * center, 2 * center), pygame.SRCALPHA)
+        pygame.draw.circle(surface, self.color, (center, center), radius, width=self.width)
+        # Smooth the outer and inner edge of the line.
+        pygame.gfxdraw.aacircle(surface, center, center, radius, self.color)
+        pygame.gfxdraw.aacircle(surface, center, center, radius - self.width, self.color)
+        surface = surface.convert_alpha()
+        surface.set_alpha(255, pygame.RLEACCEL)
+        return surface
+
+
+class RingCells:
+    """
+    Active rings bucketed by the screen cells they cover, so a click is only tested against the rings in its cell.
+    """
+
+    def __init__(self, cell_size=128):
+        """
+        :param cell_size: Width and height of a cell in pixels. Rings this size cover at most 4 cells.
+        """
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> list of rings covering the cell
+
+    def clear(self):
+        self.cells.clear()
+
+    def ring_cells(self, ring):
+        size = self.cell_size
+        for column in range(int(ring.x // size), int((ring.x + ring.width - 1) // size) + 1):
+            for row in range(int(ring.y // size), int((ring.y + ring.height - 1) // size) + 1):
+                yield column, row
+
+    def add(self, ring):
+        for cell in self.ring_cells(ring):
+            self.cells.setdefault(cell, []).append(ring)
+
+    def remove(self, ring):
+        for cell in self.ring_cells(ring):
+            rings = self.cells[cell]
+            rings.remove(ring)
+            if not rings:
+                del self.cells[cell]
+
+    def at(self, x, y):
+        """
+        :return: The rings under the given screen position.
+        """
+        rings = self.cells.get((int(x // self.cell_size), int(y // self.cell_size)), ())
+        return [ring for ring in rings if ring.contains(x, y)]
+
+
 class MinigameScreen(GameScreen):
     """
     The GameScreen that represents the ring-clicking minigame.
@@ -85,15 +169,22 @@ class MinigameScreen(GameScreen):
         self.gameplay_screen = gameplay_screen
 
         self.counting_down = True
-        self.start_ticks = None  # Countdown ticks
-        self.ring_ticks = None  # Ring spawn ticks
+        self.start_time = None  # Countdown time (s)
+        self.ring_time = None  # Ring spawn time (s)
         self.counter = 7
         self.counter_str = str(self.counter)
         self.difficulty = 4
         self.minigame_mode = False
 
-        self.active_rings = []
-        self.dormant_rings = []
+        self.num_rings = 15  # The number of rings used in the game. CAN BE CHANGED.
+        self.active_rings = []  # Rings on screen, in the order they appeared
+        self.dormant_rings = []  # Rings still to appear, the next one last
+        self.ring_cells = RingCells()  # Active rings by screen cell, for hit testing clicks
+        self.ring_outlines = RingOutlines()  # Outer circles of the rings, kept for the next minigames
+        self.ring_sprite = None  # RLE accelerated copy of the ring image, made on first use
+
+        # Lines of text (text, size, y offset) shown after the minigame ended, while the result is being played out.
+        self.result_lines = None
 
         # ----- Ring spawn time variables. -----#
 
@@ -105,34 +196,32 @@ class MinigameScreen(GameScreen):
         The method is is first run when game.py switches to this GameScreen. It cleans up any and resets any previous
         minigame variables.
         """
-        pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), 'assets/minigame_bgm.mp3'))
-        pygame.mixer.music.play(-1)
+        self.game.music.play('assets/minigame_bgm.mp3')
+        # Played when the minigame is lost.
+        self.game.music.preload('assets/gameover_bgm.mp3')
+
+        # Already loaded when the minigame was started from a boss encounter.
+        self.game.assets.preload("boss")
 
         # If the previous minigame was played from main menu, reset the bool.
         self.minigame_mode = False
 
         self.dormant_rings.clear()
         self.active_rings.clear()
-
-        num_rings = 15  # The number of rings used in the game. CAN BE CHANGED.
-        while len(self.dormant_rings) < num_rings:
-            new_ring = Ring(random.randrange(self.game.WIDTH - 128), random.randrange(self.game.HEIGHT - 128),
-                            self.game.assets["circle"], self.game)
-            # If this is the first ring to be inserted, don't check for collisions since none exist.
-            if not self.dormant_rings:
-                self.dormant_rings.append(new_ring)
-            else:
-                # Check the distance between neighboring rings. If it is shorter than radius * 2 (diameter), the rings
-                # are too close together. Discard the newly generated ring.
-                collided = False
-                for neighbor in self.dormant_rings:
-                    new_x, new_y = new_ring.center()
-                    neighbor_x, neighbor_y = neighbor.center()
-                    distance = sqrt(((new_x - neighbor_x) ** 2) + ((new_y - neighbor_y) ** 2))
-                    if distance < new_ring.radius * 2:
-                        collided = True
-                if not collided:
-                    self.dormant_rings.append(new_ring)
+        self.ring_cells.clear()
+        self.result_lines = None
+
+        # Place the rings (by their top left corner) on the screen without overlapping, at least a diameter apart.
+        # Raises spatial.PlacementError if that many rings don't fit.
+        if self.ring_sprite is None:
+            # Blits of an RLE accelerated image skip its transparent pixels. Atlas frames can't be RLE accelerated.
+            self.ring_sprite = self.game.assets["circle"].copy()
+            self.ring_sprite.set_alpha(255, pygame.RLEACCEL)
+        sprite = self.ring_sprite
+        diameter = sprite.get_width()
+        for x, y in poisson_disk_sample(self.game.WIDTH - diameter, self.game.HEIGHT - diameter, diameter,
+                                        self.num_rings, self.gameplay_screen.rng):
+            self.dormant_rings.append(Ring(x, y, sprite, self.ring_outlines, self.game))
 
         # Ring spawn time variables. All of them can be changed to suite needs of the game
         if self.gameplay_screen.level == 0:
@@ -152,66 +241,81 @@ class MinigameScreen(GameScreen):
         self.counting_down = True
         self.counter = 7  # 7 was chosen since the background music's beat drops after 7 seconds.
         self.counter_str = str(self.counter)
-        self.start_ticks = pygame.time.get_ticks()
-        self.ring_ticks = pygame.time.get_ticks()
+        self.start_time = self.game.sim_time
+        self.ring_time = self.game.sim_time
 
     def update(self):
         """
         The update method controls the logic of either the game's countdown or the ring spawn times and user interaction
         """
         if self.counting_down:
-            seconds = (pygame.time.get_ticks() - self.start_ticks) / 1000
+            seconds = self.game.sim_time - self.start_time
             if seconds >= 1 and self.counter > 0:
                 self.counter -= 1
                 if self.counter > 0:
                     self.counter_str = str(self.counter)
-                    self.start_ticks = pygame.time.get_ticks()
+                    self.start_time = self.game.sim_time
             elif self.counter == 0:
                 self.counting_down = False
 
         else:
             # Change rings from dormant to active based on spawn times.
             if self.dormant_rings:
-                seconds = (pygame.time.get_ticks() - self.ring_ticks) / 1000
-                if seconds >= random.uniform(self.min_spawn_time, self.max_spawn_time):
-                    self.active_rings.append(self.dormant_rings.pop(0))
-                    self.ring_ticks = pygame.time.get_ticks()
-
-            for ring in self.active_rings:
-                try:
-                    clicked = ring.update()
-                    if clicked:
-                        self.active_rings.remove(ring)
-                except ClickedTooLate:
-                    # User clicked too late. User lost!
-                    if self.game.prev_game_screen == self.game.scrn_main_menu:
-                        self.minigame_mode = True
-                        self.punishment()
-                        self.game.show_main_menu_screen()
-                        return
-                    else:
-                        self.minigame_mode = False
-                        self.punishment()
-                        self.game.show_gameplay_screen()
-                        return
+                seconds = self.game.sim_time - self.ring_time
+                if seconds >= self.gameplay_screen.rng.uniform(self.min_spawn_time, self.max_spawn_time):
+                    ring = self.dormant_rings.pop()
+                    self.active_rings.append(ring)
+                    self.ring_cells.add(ring)
+                    self.ring_time = self.game.sim_time
+
+            # A click only tests the rings under the mouse.
+            if self.game.mouse_clicked:
+                for ring in self.ring_cells.at(*self.game.mouse_pos):
+                    if ring.click() == Ring.HIT:
+                        self.ring_cells.remove(ring)
+
+            # Update the rings, keeping the ones still shrinking at the front of the list.
+            active_rings = self.active_rings
+            shrinking = Ring.SHRINKING
+            kept = 0
+            missed = False
+            for ring in active_rings:
+                state = ring.update()
+                if state == shrinking:
+                    active_rings[kept] = ring
+                    kept += 1
+                elif state == Ring.MISSED:
+                    missed = True
+            del active_rings[kept:]
+
+            if missed:
+                # User clicked too late. User lost!
+                if self.game.prev_game_screen == self.game.scrn_main_menu:
+                    self.minigame_mode = True
+                    self.punishment(self.game.show_main_menu_screen)
+                else:
+                    self.minigame_mode = False
+                    self.punishment(self.game.show_gameplay_screen)
+                return
 
             if not self.active_rings and not self.dormant_rings:
                 # User has successfully clicked all rings in time. User won!
                 if self.game.prev_game_screen == self.game.scrn_main_menu:
                     self.minigame_mode = True
-                    self.reward()
-                    self.game.show_main_menu_screen()
+                    self.reward(self.game.show_main_menu_screen)
                 else:
                     self.minigame_mode = False
-                    self.reward()
-                    self.game.show_gameplay_screen()
+                    self.reward(self.game.show_gameplay_screen)
 
     def render(self):
         """
         The render method draws all minigame elements onto the screen. This includes the countdown and the rings.
         """
         self.game.screen.blit(self.game.assets["bg_minigame"], (0, 0))
-        if self.counting_down:
+        if self.result_lines is not None:
+            for text, size, y_offset in self.result_lines:
+                self.game.draw_text(text, size, self.game.WIDTH / 2, self.game.HEIGHT / 2 + y_offset)
+        elif self.counting_down:
             self.game.draw_text('Boss battle! Get ready to click!', 40, self.game.WIDTH / 2, self.game.HEIGHT / 2 - 80)
             self.game.draw_text(self.counter_str, 80, self.game.WIDTH / 2, self.game.HEIGHT / 2)
 
@@ -228,16 +332,19 @@ class MinigameScreen(GameScreen):
             for ring in self.active_rings:
                 ring.render()
 
-    def reward(self):
-        pygame.mixer.music.stop()
+    def reward(self, next_screen):
+        """
+        Shows the success message and grants the reward. The game switches to next_screen once the win SFX is done.
 
-        self.game.screen.blit(self.game.assets["bg_minigame"], (0, 0))
-        self.game.draw_text("Success!", 60, self.game.WIDTH / 2, self.game.HEIGHT / 2)
+        :param next_screen: Game method that switches to the next screen.
+        """
+        self.game.music.stop()
+
+        self.result_lines = [("Success!", 60, 0)]
 
         if self.game.prev_game_screen != self.game.scrn_main_menu:
-            self.game.draw_text("You will now be granted a massive", 50, self.game.WIDTH / 2,
-                                self.game.HEIGHT / 2 + 80)
-            self.game.draw_text("boost with invincibility!", 50, self.game.WIDTH / 2, self.game.HEIGHT / 2 + 150)
+            self.result_lines.append(("You will now be granted a massive", 50, 80))
+            self.result_lines.append(("boost with invincibility!", 50, 150))
 
             self.gameplay_screen.player.immune = True
             self.gameplay_screen.player.jumped = False
@@ -245,34 +352,39 @@ class MinigameScreen(GameScreen):
             self.gameplay_screen.player.on_ground = True
             self.gameplay_screen.player.vel.y = -50.0
 
-        pygame.display.update()
-
-        self.game.assets["sfx_boss_win"].play()
-        while pygame.mixer.get_busy():
-            continue
+        self.game.scheduler.after_sound(self.game.assets["sfx_boss_win"], lambda: self.finish_reward(next_screen),
+                                        blocking=True)
 
+    def finish_reward(self, next_screen):
+        # The boss encounter cues were played, drop them until the next boss.
+        self.game.assets.release_transient()
         if self.game.prev_game_screen != self.game.scrn_main_menu:
             self.game.assets["sfx_boostjump"].play()
+        next_screen()
 
-    def punishment(self):
-        pygame.mixer.music.stop()
+    def punishment(self, next_screen):
+        """
+        Shows the failure message and applies the punishment. The game switches to next_screen after 3.5 seconds.
 
-        self.game.screen.blit(self.game.assets["bg_minigame"], (0, 0))
-        self.game.draw_text("Better luck next time!", 60, self.game.WIDTH / 2, self.game.HEIGHT / 2)
+        :param next_screen: Game method that switches to the next screen.
+        """
+        self.game.music.stop()
+
+        self.result_lines = [("Better luck next time!", 60, 0)]
 
         if self.game.prev_game_screen != self.game.scrn_main_menu:
-            self.game.draw_text("Your progress will now be", 40, self.game.WIDTH / 2,
-                                self.game.HEIGHT / 2 + 80)
-            self.game.draw_text("decreased substantially!", 40, self.game.WIDTH / 2, self.game.HEIGHT / 2 + 120)
+            self.result_lines.append(("Your progress will now be", 40, 80))
+            self.result_lines.append(("decreased substantially!", 40, 120))
 
             self.gameplay_screen.times_hit += 2
             self.gameplay_screen.progress = self.gameplay_screen.best_distance - \
                 self.gameplay_screen.enm_hit_penalty * self.gameplay_screen.times_hit
             self.gameplay_screen.rand_dist = 0
 
-        pygame.display.update()
+        self.game.music.play('assets/gameover_bgm.mp3')
+        self.game.scheduler.after(3500, lambda: self.finish_punishment(next_screen), blocking=True)
 
-        pygame.mixer.music.load(os.path.join(os.path.dirname(__file__), 'assets/gameover_bgm.mp3'))
-        pygame.mixer.music.play(-1)
-        time.sleep(3.5)
-        pygame.mixer.music.stop()
+    def finish_punishment(self, next_screen):
+        self.game.assets.release_transient()
+        self.game.music.stop()
+        next_screen()
@@ -0,0 +1,230 @@
+import io
+import os
+import time
+import struct
+import pygame
+from concurrent.futures import ThreadPoolExecutor
+
+# --------------- Track length --------------- #
+#
+#   Resuming a looping track needs its length. pygame only tells it by decoding the whole track with the mixer, which
+#   mustn't be used off the main thread and takes too long on it, so the length is read from the file's headers.
+
+# MPEG audio bitrates in kbit/s by bitrate index, for (MPEG-1, layer) and (MPEG-2 or 2.5, layer).
+MP3_BITRATES = {(1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+                (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+                (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+                (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+                (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+                (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+# Sample rates by MPEG version bits, 1 is reserved.
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def mp3_length(data):
+    """
+    Adds up the samples of every MPEG audio frame. Exact for constant and variable bitrate files alike.
+
+    :return: Length in seconds, None if there are no frames.
+    """
+    i = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2 tag, its size is stored 7 bits per byte, plus a footer if flagged.
+        size = (data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F)
+        i = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    seconds = 0
+    end = len(data) - 4
+    while i <= end:
+        b1, b2 = data[i + 1], data[i + 2]
+        version = (b1 >> 3) & 3
+        layer = 4 - ((b1 >> 1) & 3)
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 3
+        if data[i] != 0xFF or b1 & 0xE0 != 0xE0 or version == 1 or layer == 4 or bitrate_index in (0, 15) \
+                or rate_index == 3:
+            # Not a frame header, look for the next one.
+            i += 1
+            continue
+        bitrate = MP3_BITRATES[(1 if version == 3 else 2, layer)][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        padding = (b2 >> 1) & 1
+        if layer == 1:
+            samples = 384
+            frame_size = (12 * bitrate // sample_rate + padding) * 4
+        else:
+            samples = 576 if layer == 3 and version != 3 else 1152
+            frame_size = samples // 8 * bitrate // sample_rate + padding
+        seconds += samples / sample_rate
+        i += frame_size
+    return seconds or None
+
+
+def ogg_length(data):
+    """
+    Reads the position of the last Ogg page, in samples, and the sample rate of the Vorbis stream.
+
+    :return: Length in seconds, None if it isn't an Ogg Vorbis file.
+    """
+    header = data.find(b"\x01vorbis")
+    last_page = data.rfind(b"OggS")
+    if header < 0 or last_page < 0 or len(data) < max(header + 16, last_page + 14):
+        return None
+    sample_rate = struct.unpack_from("<I", data, header + 12)[0]
+    granule_position = struct.unpack_from("<q", data, last_page + 6)[0]
+    return granule_position / sample_rate if sample_rate > 0 and granule_position > 0 else None
+
+
+def track_length(data, extension):
+    """
+    :param data: The track's file contents.
+    :param extension: File extension, telling the format.
+    :return: Length of the track in seconds, None if unknown.
+    """
+    if extension.lower() == ".mp3":
+        return mp3_length(data)
+    if extension.lower() == ".ogg":
+        return ogg_length(data)
+    return None
+
+
+class MusicPlayer:
+    """
+    Background music. Wraps pygame.mixer.music, which streams a track while playing it.
+
+    Tracks are read into memory ahead of time: screens call preload() with the tracks they are likely to switch to, and
+    a background thread reads them while the current screen is shown. play() then starts the track from memory instead
+    of opening it on disk in the middle of a screen transition. Tracks stay in memory once read, there are only a few.
+
+    The player remembers where each track was stopped, so a track can be resumed where it left off. The time each
+    play() took is recorded in latencies.
+
+    Only the main thread uses the mixer. The loader thread reads files and their headers, see track_length().
+    """
+
+    def __init__(self, base_dir):
+        """
+        :param base_dir: Directory track paths are relative to.
+        """
+        self.base_dir = base_dir
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="MusicLoader")
+        self.loads = {}  # Track -> Future of the track's bytes
+        self.lengths = {}  # Track -> length in seconds, None if unknown. Set by the loader once the track is read.
+        self.stream = None  # File object the current track is played from. pygame reads it while playing.
+
+        self.track = None  # Track playing or paused, None if stopped
+        self.start_position = 0  # Position (s) in the track the current playback started at, loops included
+        self.positions = {}  # Track -> position (s) it was stopped at, loops included
+
+        # One entry per play(): (track, seconds play() took, True if the track was already in memory).
+        self.latencies = []
+
+    # --------------- Loading --------------- #
+
+    def preload(self, *tracks):
+        """
+        Starts reading the tracks in the background, unless they are already read or being read.
+
+        :param tracks: Track paths, relative to base_dir.
+        """
+        for track in tracks:
+            if track not in self.loads:
+                self.loads[track] = self.loader.submit(self.load, track)
+
+    def load(self, track):
+        """
+        Reads a track and its length. Runs on the loader thread.
+        """
+        with open(os.path.join(self.base_dir, track), "rb") as f:
+            data = f.read()
+        try:
+            self.lengths[track] = track_length(data, os.path.splitext(track)[1])
+        except (IndexError, KeyError, struct.error):
+            self.lengths[track] = None
+        return data
+
+    def loaded(self, track):
+        """
+        :return: True if the track is in memory.
+        """
+        future = self.loads.get(track)
+        return future is not None and future.done() and future.exception() is None
+
+    # --------------- Playback --------------- #
+
+    def play(self, track, loops=-1, resume=False):
+        """
+        Stops the current track and plays another one. Waits for the track if it's still being read, or reads it now if
+        it wasn't preloaded.
+
+        :param track: Track path, relative to base_dir.
+        :param loops: Number of times to repeat the track, -1 to repeat it forever.
+        :param resume: Continue from where the track was last stopped, instead of from the start.
+        """
+        self.stop()
+        start = time.perf_counter()
+        preloaded = self.loaded(track)
+        self.preload(track)
+        self.stream = io.BytesIO(self.loads[track].result())
+        pygame.mixer.music.load(self.stream, os.path.splitext(track)[1][1:])
+
+        position = self.positions.pop(track, 0) if resume else 0
+        # The track loops, the position includes every loop before. Without the length, the track starts over.
+        length = self.length(track)
+        if not length:
+            position = 0
+        try:
+            if position:
+                pygame.mixer.music.play(loops, position % length)
+            else:
+                pygame.mixer.music.play(loops)
+        except pygame.error:
+            position = 0
+            pygame.mixer.music.play(loops)
+        self.track = track
+        self.start_position = position
+        self.latencies.append((track, time.perf_counter() - start, preloaded))
+
+    def stop(self):
+        """
+        Stops the current track, remembering where it was stopped.
+        """
+        if self.track is not None:
+            self.positions[self.track] = self.elapsed()
+            self.track = None
+        pygame.mixer.music.stop()
+
+    def length(self, track):
+        """
+        :return: The track's length in seconds, None if unknown or if the track wasn't read yet.
+        """
+        return self.lengths.get(track)
+
+    def pause(self):
+        pygame.mixer.music.pause()
+
+    def unpause(self):
+        pygame.mixer.music.unpause()
+
+    def elapsed(self):
+        """
+        :return: Seconds of the current track played since it was started from the beginning, loops included. None if
+            no track is playing.
+        """
+        if self.track is None:
+            return None
+        position = pygame.mixer.music.get_pos()
+        return self.start_position + max(position, 0) / 1000
+
+    # --------------- Diagnostics --------------- #
+
+    def latency_stats(self):
+        """
+        :return: Dictionary with the number of tracks played, how many of them were preloaded, and the mean and
+            maximum time in seconds play() took.
+        """
+        times = [latency for _, latency, _ in self.latencies]
+        return {"plays": len(times),
+                "preloaded": sum(1 for _, _, preloaded in self.latencies if preloaded),
+                "mean": sum(times) / len(times) if times else 0,
+                "max": max(times, default=0)}
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+APP_DIR_NAME = "ShootingForTheStars"
+
+
+def user_data_dir():
+    """
+    Returns the per-user directory the game saves to, creating it if needed. Set the SFTS_DATA_DIR environment variable
+    to use another directory.
+    """
+    path = os.environ.get("SFTS_DATA_DIR")
+    if not path:
+        if sys.platform == "win32":
+            base = os.environ.get("APPDATA") or os.path.expanduser("~")
+        elif sys.platform == "darwin":
+            base = os.path.expanduser("~/Library/Application Support")
+        else:
+            base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+        path = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def write_atomic(path, text):
+    """
+    Writes a file so that it either has its old or its new contents, never part of them: the text goes to a temporary
+    file next to it, which then replaces it.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+class UserDataStore:
+    """
+    JSON data kept in memory and written to disk behind the game's back. save() only records the data and returns, a
+    background thread writes it. Saves that come in while a write is pending are merged into one write of the latest
+    data, and data that didn't change since the last write isn't written again.
+
+    Pending data is written when the game exits, or on flush().
+    """
+
+    COALESCE_DELAY = 0.25  # Seconds the writer waits for more saves before writing
+
+    def __init__(self, path, default, legacy_path=None):
+        """
+        :param path: File the data is saved to.
+        :param default: Data to use if there is no saved data yet.
+        :param legacy_path: File the data used to be saved to. Read if there is nothing at path yet, and copied there.
+        """
+        self.path = path
+        self.lock = threading.Condition()
+        self.pending = None  # Serialized data waiting to be written
+        self.written = None  # Serialized data last known to be on disk
+        self.closed = False
+        self.hurry = False  # Write without waiting for more saves
+        self.thread = None
+
+        self.data = self.read(path)
+        if self.data is not None:
+            self.written = json.dumps(self.data)
+        elif legacy_path is not None:
+            self.data = self.read(legacy_path)
+            if self.data is not None:
+                self.save(self.data)
+        if self.data is None:
+            self.data = default
+
+        atexit.register(self.close)
+
+    @staticmethod
+    def read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, data):
+        """
+        Schedules the data to be written. Doesn't wait for the disk.
+        """
+        text = json.dumps(data)
+        with self.lock:
+            if self.closed:
+                return
+            self.data = data
+            self.pending = text
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.write_loop, name="UserDataStore", daemon=True)
+                self.thread.start()
+            self.lock.notify()
+
+    def flush(self):
+        """
+        Waits until the last saved data is on disk.
+        """
+        with self.lock:
+            self.hurry = True
+            self.lock.notify_all()
+            while self.pending is not None and self.thread is not None and self.thread.is_alive():
+                self.lock.wait(0.1)
+            self.hurry = False
+
+    def close(self):
+        """
+        Writes the pending data and stops the writer thread. Called at exit.
+        """
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.closed:
+                    self.lock.wait()
+                if self.pending is None:
+                    return
+                # Let a burst of saves settle, unless the game is exiting or waiting for the write.
+                deadline = time.monotonic() + self.COALESCE_DELAY
+                while not self.closed and not self.hurry:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.lock.wait(remaining)
+                text = self.pending
+
+            if text != self.written:
+                try:
+                    write_atomic(self.path, text)
+                    self.written = text
+                except OSError as e:
+                    print("Couldn't save user data to %s: %s" % (self.path, e), file=sys.stderr)
+
+            with self.lock:
+                # Clear it unless a newer save came in while writing.
+                if self.pending is text:
+                    self.pending = None
+                self.lock.notify_all()
+
+
+class MemoryDataStore:
+    """
+    Stands in for a UserDataStore when nothing may be written to disk. Keeps the saved data in memory only.
+    """
+
+    def __init__(self, default):
+        """
+        :param default: Data to start with.
+        """
+        self.data = default
+
+    def save(self, data):
+        self.data = data
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
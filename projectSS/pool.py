@@ -0,0 +1,49 @@
+class EntityPool:
+    """
+    Free list of killed entities of one type. GameplayScreen creates its platforms, enemies, powerups and pushers
+    through a pool, so endless mode reuses the same few objects instead of allocating new ones as the player climbs.
+
+    A pooled entity class splits its constructor in two: __init__() does the one-time setup and calls spawn(), which
+    (re)initializes the entity from the constructor arguments. Killing a pooled entity hands it back to its pool.
+    """
+
+    def __init__(self, cls):
+        """
+        :param cls: The Entity subclass kept by this pool.
+        """
+        self.cls = cls
+        self.free = []
+
+        # Statistics. Every acquire() either allocates a new entity or reuses a free one.
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, gameplay_screen, *args):
+        """
+        Returns an entity spawned with the given arguments, reusing a free one when possible.
+
+        :param gameplay_screen: GameplayScreen the entity belongs to.
+        :param args: Arguments of the entity's spawn() method.
+        """
+        if not self.free:
+            self.created += 1
+            entity = self.cls(gameplay_screen, *args)
+            entity.pool = self
+            return entity
+
+        self.reused += 1
+        entity = self.free.pop()
+        entity.in_pool = False
+        entity.prev_pos = None
+        entity.add(*entity.spawn_groups)
+        entity.spawn(*args)
+        return entity
+
+    def release(self, entity):
+        """
+        Takes back a killed entity. Called by Entity.kill(), entities already in the pool are ignored.
+        """
+        if not entity.in_pool:
+            entity.in_pool = True
+            self.free.append(entity)
+
@@ -0,0 +1,209 @@
+import struct
+from projectSS.controls import Controls, JUMP_OFFSET_UNIT
+
+# --------------- Replay file format --------------- #
+#
+#   Header: magic b"SFTR", format version (uint8), level (uint8), level seed (uint32), simulation rate (uint16).
+#   Body: one record per run of identical game logic steps:
+#       * Input flags (uint8), see the constants below.
+#       * If CLICK is set, the mouse position as two uint16.
+#       * If TIMED_JUMP is set, when the jump key was pressed relative to the step, as an int16 in JUMP_OFFSET_UNITs.
+#       * Number of steps in the run, as an unsigned LEB128 varint.
+#   All integers are little-endian. Version 1 is the same format without TIMED_JUMP.
+
+MAGIC = b"SFTR"
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+HEADER = struct.Struct("<4sBBIH")
+MOUSE_POS = struct.Struct("<HH")
+JUMP_OFFSET = struct.Struct("<h")
+
+# Input flags, one bit per control.
+LEFT = 1
+RIGHT = 2
+JUMP = 4
+PAUSE = 8
+CLICK = 16
+TIMED_JUMP = 32
+
+
+class ReplayError(Exception):
+    """
+    Raised when a replay can't be decoded.
+    """
+    pass
+
+
+class Replay:
+    """
+    The recorded input of a single run, with the level and seed needed to play it back.
+    """
+
+    def __init__(self, level=0, seed=0, sim_rate=60):
+        self.level = level
+        self.seed = seed
+        self.sim_rate = sim_rate
+        # Runs of identical steps as [flags, mouse_pos or None, jump offset in JUMP_OFFSET_UNITs or None, step count]
+        self.records = []
+
+    @property
+    def ticks(self):
+        return sum(record[3] for record in self.records)
+
+    def append(self, flags, mouse_pos=None, jump_offset=None):
+        """
+        Appends one game logic step.
+
+        :param flags: Input flags of the step.
+        :param mouse_pos: Mouse position, only stored if the CLICK flag is set.
+        :param jump_offset: Jump key press time in JUMP_OFFSET_UNITs, only stored if the TIMED_JUMP flag is set.
+        """
+        if not flags & CLICK:
+            mouse_pos = None
+        if not flags & TIMED_JUMP:
+            jump_offset = None
+        if self.records:
+            last = self.records[-1]
+            if last[0] == flags and last[1] == mouse_pos and last[2] == jump_offset:
+                last[3] += 1
+                return
+        self.records.append([flags, mouse_pos, jump_offset, 1])
+
+    def encode(self):
+        """
+        :return: The replay as bytes.
+        """
+        data = bytearray(HEADER.pack(MAGIC, VERSION, self.level, self.seed, self.sim_rate))
+        for flags, mouse_pos, jump_offset, count in self.records:
+            data.append(flags)
+            if mouse_pos is not None:
+                data += MOUSE_POS.pack(max(0, mouse_pos[0]), max(0, mouse_pos[1]))
+            if jump_offset is not None:
+                data += JUMP_OFFSET.pack(jump_offset)
+            while count >= 0x80:
+                data.append((count & 0x7F) | 0x80)
+                count >>= 7
+            data.append(count)
+        return bytes(data)
+
+    @classmethod
+    def decode(cls, data):
+        """
+        :param data: Bytes produced by encode().
+        :return: Replay
+        """
+        if len(data) < HEADER.size:
+            raise ReplayError("Replay is too short")
+        magic, version, level, seed, sim_rate = HEADER.unpack_from(data)
+        if magic != MAGIC or version not in SUPPORTED_VERSIONS:
+            raise ReplayError("Not a replay, or an unsupported replay version")
+
+        replay = cls(level, seed, sim_rate)
+        i = HEADER.size
+        try:
+            while i < len(data):
+                flags = data[i]
+                i += 1
+                mouse_pos = None
+                if flags & CLICK:
+                    mouse_pos = MOUSE_POS.unpack_from(data, i)
+                    i += MOUSE_POS.size
+                jump_offset = None
+                if flags & TIMED_JUMP:
+                    jump_offset = JUMP_OFFSET.unpack_from(data, i)[0]
+                    i += JUMP_OFFSET.size
+                count = 0
+                shift = 0
+                while True:
+                    byte = data[i]
+                    i += 1
+                    count |= (byte & 0x7F) << shift
+                    shift += 7
+                    if byte < 0x80:
+                        break
+                if count == 0:
+                    raise ReplayError("Replay contains an empty record")
+                replay.records.append([flags, mouse_pos, jump_offset, count])
+        except (IndexError, struct.error):
+            raise ReplayError("Replay is truncated")
+        return replay
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.encode())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.decode(f.read())
+
+
+class ReplayRecorder(Controls):
+    """
+    Controls that pass through the input of other controls and record it into a Replay.
+    """
+
+    def __init__(self, source, level, seed, sim_rate):
+        """
+        :param source: The controls being recorded.
+        """
+        super().__init__()
+        self.source = source
+        self.replay = Replay(level, seed, sim_rate)
+
+    def poll(self, game):
+        source = self.source
+        source.poll(game)
+        self.left = source.left
+        self.right = source.right
+        self.jump = source.jump
+        self.pause = source.pause
+        self.click = source.click
+        self.mouse_pos = source.mouse_pos
+        self.jump_offset = source.jump_offset
+
+        flags = (LEFT if self.left else 0) | (RIGHT if self.right else 0) | (JUMP if self.jump else 0) | \
+            (PAUSE if self.pause else 0) | (CLICK if self.click else 0)
+        jump_offset = None
+        if self.jump_offset is not None:
+            flags |= TIMED_JUMP
+            jump_offset = round(self.jump_offset / JUMP_OFFSET_UNIT)
+        self.replay.append(flags, self.mouse_pos, jump_offset)
+
+
+class ReplayControls(Controls):
+    """
+    Controls that play back a Replay, one recorded step per poll. Once the replay has ended, nothing is pressed.
+    """
+
+    def __init__(self, replay):
+        super().__init__()
+        self.replay = replay
+        self.record = 0  # Index of the current record
+        self.remaining = replay.records[0][3] if replay.records else 0  # Steps left in the current record
+
+    @property
+    def finished(self):
+        return self.record >= len(self.replay.records)
+
+    def poll(self, game):
+        if self.finished:
+            self.left = self.right = self.jump = self.pause = self.click = False
+            self.jump_offset = None
+            return
+
+        flags, mouse_pos, jump_offset, _ = self.replay.records[self.record]
+        self.left = bool(flags & LEFT)
+        self.right = bool(flags & RIGHT)
+        self.jump = bool(flags & JUMP)
+        self.pause = bool(flags & PAUSE)
+        self.click = bool(flags & CLICK)
+        if mouse_pos is not None:
+            self.mouse_pos = mouse_pos
+        self.jump_offset = jump_offset * JUMP_OFFSET_UNIT if jump_offset is not None else None
+
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.record += 1
+            if not self.finished:
+                self.remaining = self.replay.records[self.record][3]
@@ -0,0 +1,131 @@
+import sys
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    finished_at REAL NOT NULL,  -- Unix time
+    level INTEGER NOT NULL,
+    seed INTEGER,
+    score REAL NOT NULL,  -- GameplayScreen.best_distance
+    times_hit INTEGER NOT NULL,
+    duration REAL NOT NULL,  -- Seconds of game time
+    outcome TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_level_score ON runs (level, score DESC);
+CREATE INDEX IF NOT EXISTS runs_by_finished_at ON runs (finished_at DESC);
+"""
+
+
+class RunHistory:
+    """
+    Record of every finished run, in a local SQLite database. The database is only used from a worker thread:
+    record() queues a run and returns, and the queries return a concurrent.futures.Future that is resolved by the
+    worker. Game screens check the future once per step instead of waiting for it.
+
+    Runs recorded close together are inserted in one transaction. A query sees every run recorded before it.
+    """
+
+    BATCH_SIZE = 64  # Most runs inserted in one transaction
+
+    # Outcomes of a run
+    DIED = "died"
+    COMPLETED = "completed"
+    QUIT = "quit"
+
+    def __init__(self, path):
+        """
+        :param path: Database file, created if it doesn't exist.
+        """
+        self.path = path
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.work, name="RunHistory", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def record(self, level, seed, score, times_hit, duration, outcome):
+        """
+        Queues a finished run to be stored.
+
+        :param level: Level played, 0 to 2, 3 for endless mode.
+        :param seed: Level seed of the run.
+        :param score: Best distance reached.
+        :param times_hit: Number of times the player was hit.
+        :param duration: Length of the run in seconds of game time.
+        :param outcome: RunHistory.DIED, COMPLETED or QUIT.
+        """
+        self.requests.put(("record", (time.time(), level, seed, score, times_hit, duration, outcome)))
+
+    def top_scores(self, level, count=5):
+        """
+        :return: Future of a list of the best runs of the level as (score, times_hit, finished_at), best first.
+        """
+        return self.query("SELECT score, times_hit, finished_at FROM runs WHERE level = ? "
+                          "ORDER BY score DESC LIMIT ?", (level, count))
+
+    def recent_runs(self, count=10):
+        """
+        :return: Future of a list of the last runs as (level, score, outcome, finished_at), latest first.
+        """
+        return self.query("SELECT level, score, outcome, finished_at FROM runs ORDER BY finished_at DESC LIMIT ?",
+                          (count,))
+
+    def query(self, sql, parameters):
+        future = Future()
+        self.requests.put(("query", (sql, parameters, future)))
+        return future
+
+    def close(self):
+        """
+        Stores the queued runs and stops the worker. Called at exit.
+        """
+        if self.thread.is_alive():
+            self.requests.put(("close", None))
+            self.thread.join()
+
+    def work(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.executescript(SCHEMA)
+        connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+        connection.commit()
+
+        pending = []  # Runs waiting to be inserted
+
+        def insert():
+            if pending:
+                try:
+                    with connection:
+                        connection.executemany("INSERT INTO runs (finished_at, level, seed, score, times_hit, "
+                                               "duration, outcome) VALUES (?, ?, ?, ?, ?, ?, ?)", pending)
+                except sqlite3.Error as e:
+                    print("Couldn't save %d runs to %s: %s" % (len(pending), self.path, e), file=sys.stderr)
+                pending.clear()
+
+        while True:
+            kind, request = self.requests.get()
+            if kind == "record":
+                pending.append(request)
+                # Wait for the runs queued right behind this one, unless there are enough for a batch already.
+                if len(pending) < self.BATCH_SIZE and not self.requests.empty():
+                    continue
+                insert()
+            elif kind == "query":
+                sql, parameters, future = request
+                insert()
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(connection.execute(sql, parameters).fetchall())
+                    except sqlite3.Error as e:
+                        future.set_exception(e)
+            else:
+                insert()
+                connection.close()
+                return
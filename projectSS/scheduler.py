@@ -0,0 +1,76 @@
+class Scheduler:
+    """
+    Runs callbacks once a delay has elapsed or a condition is met, without stopping the game loop. Game.update() calls
+    update() once per tick.
+
+    A task can be blocking. While a blocking task is pending, Game doesn't update the current game screen, but it keeps
+    handling window events and rendering. Used for timed transitions, like waiting for a sound cue to finish.
+    """
+
+    def __init__(self):
+        self.tasks = []  # Pending tasks as [due time or None, condition or None, callback, blocking]
+        self.now = 0  # Time (ms) of the last update
+
+    def after(self, delay, callback, blocking=False):
+        """
+        Calls callback once delay milliseconds have passed.
+
+        :param delay: Delay in milliseconds.
+        :param callback: Function called without arguments.
+        :param blocking: True pauses the current game screen's logic until the callback is called.
+        """
+        self.tasks.append([self.now + delay, None, callback, blocking])
+
+    def when(self, condition, callback, blocking=False):
+        """
+        Calls callback on the first update where condition() returns True.
+
+        :param condition: Function called without arguments on each update.
+        :param callback: Function called without arguments.
+        :param blocking: True pauses the current game screen's logic until the callback is called.
+        """
+        self.tasks.append([None, condition, callback, blocking])
+
+    def after_sound(self, sound, callback, blocking=False):
+        """
+        Plays a sound and calls callback once the sound has finished playing.
+
+        :param sound: pygame.mixer.Sound to play.
+        :param callback: Function called without arguments.
+        :param blocking: True pauses the current game screen's logic until the callback is called.
+        """
+        sound.play()
+        self.after(sound.get_length() * 1000, callback, blocking)
+
+    @property
+    def blocking(self):
+        """
+        True if a blocking task is pending.
+        """
+        for task in self.tasks:
+            if task[3]:
+                return True
+        return False
+
+    def update(self, now):
+        """
+        Calls the callbacks of all tasks that are due.
+
+        :param now: Current time in milliseconds.
+        """
+        self.now = now
+        if not self.tasks:
+            return
+
+        # Callbacks may schedule new tasks, those are checked on the next update.
+        tasks = self.tasks
+        self.tasks = []
+        for task in tasks:
+            due, condition, callback, blocking = task
+            if (due is not None and now >= due) or (condition is not None and condition()):
+                callback()
+            else:
+                self.tasks.append(task)
+
+    def clear(self):
+        self.tasks.clear()
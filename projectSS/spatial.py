@@ -0,0 +1,183 @@
+import math
+import pygame
+
+
+class BandedGroup(pygame.sprite.Group):
+    """
+    Sprite group that also indexes its sprites by the horizontal bands of the world they overlap. Collision queries
+    only test sprites in the bands the queried sprite overlaps, instead of every sprite in the group.
+
+    Entities keep the index up to date by calling reindex() whenever their rect changes, see Entity.update_rect().
+    """
+
+    def __init__(self, band_height=64, *sprites):
+        """
+        :param band_height: Height of a band in pixels.
+        """
+        self.band_height = band_height
+        self.bands = {}  # Band number -> dict of the sprites overlapping the band, in insertion order
+        self.sprite_bands = {}  # Sprite -> [first band, last band]
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        first = sprite.rect.top // self.band_height
+        last = max(sprite.rect.bottom - 1, sprite.rect.top) // self.band_height
+        self.sprite_bands[sprite] = [first, last]
+        self.add_bands(sprite, first, last)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        span = self.sprite_bands.pop(sprite, None)
+        if span is not None:
+            self.remove_bands(sprite, span[0], span[1])
+
+    def remove_bands(self, sprite, first, last):
+        for band in range(first, last + 1):
+            sprites = self.bands[band]
+            del sprites[sprite]
+            if not sprites:
+                del self.bands[band]
+
+    def add_bands(self, sprite, first, last):
+        for band in range(first, last + 1):
+            sprites = self.bands.get(band)
+            if sprites is None:
+                sprites = self.bands[band] = {}
+            sprites[sprite] = None
+
+    def reindex(self, sprite):
+        """
+        Moves a sprite to the bands its rect currently overlaps. Does nothing if the sprite isn't in the group.
+        """
+        span = self.sprite_bands.get(sprite)
+        if span is None:
+            return
+
+        rect = sprite.rect
+        first = rect.top // self.band_height
+        last = max(rect.bottom - 1, rect.top) // self.band_height
+        if span[0] == first and span[1] == last:
+            return
+
+        self.remove_bands(sprite, span[0], span[1])
+        span[0] = first
+        span[1] = last
+        self.add_bands(sprite, first, last)
+
+    def collide(self, sprite, dokill):
+        """
+        Same as pygame.sprite.spritecollide(sprite, self, dokill), but only tests sprites sharing a band with sprite.
+
+        :param sprite: The sprite to test against the group.
+        :param dokill: True kills every colliding sprite.
+        :return: List of the sprites in this group colliding with sprite.
+        """
+        rect = sprite.rect
+        first = rect.top // self.band_height
+        last = max(rect.bottom - 1, rect.top) // self.band_height
+
+        collided = []
+        for band in range(first, last + 1):
+            sprites = self.bands.get(band)
+            if sprites is None:
+                continue
+            for other in sprites:
+                if rect.colliderect(other.rect) and other not in collided:
+                    collided.append(other)
+
+        if dokill:
+            for other in collided:
+                other.kill()
+        return collided
+
+
+class PlacementError(Exception):
+    """
+    Raised by poisson_disk_sample() when the requested number of points doesn't fit.
+    """
+
+
+def poisson_disk_sample(width, height, min_distance, count, rng, attempts=30, restarts=8):
+    """
+    Picks random points in a rectangle that are all at least min_distance apart, with Bridson's Poisson-disk sampling.
+
+    The rectangle is covered by a grid of cells small enough to hold at most one point, so checking a candidate point
+    only looks at the cells around it. The sample grows from one random point: each point tries up to attempts random
+    candidates at min_distance to 1.1 * min_distance from it before it is retired. Candidates this close, rather than
+    up to 2 * min_distance as in Bridson's paper, pack the rectangle tighter. Once no point is left to grow from, the
+    rectangle is full, and count of the points are picked at random. That takes at most attempts candidates per point
+    that fits in the rectangle, times restarts.
+
+    :param width: Width of the rectangle. Points are in [0, width).
+    :param height: Height of the rectangle. Points are in [0, height).
+    :param min_distance: Smallest distance between two points.
+    :param count: Number of points.
+    :param rng: random.Random the points are picked with.
+    :param attempts: Candidates tried around each point.
+    :param restarts: Samples drawn before giving up, when a sample ends up holding fewer than count points.
+    :return: List of count (x, y) tuples, in random order.
+    :raises PlacementError: If count points didn't fit in any of the samples.
+    """
+    if count <= 0:
+        return []
+    if width <= 0 or height <= 0:
+        raise PlacementError("No room for %d points in a %sx%s area" % (count, width, height))
+
+    cell = min_distance / 2 ** 0.5
+    columns = int(width / cell) + 1
+    rows = int(height / cell) + 1
+    best = 0
+    for _ in range(restarts):
+        points = sample_points(width, height, min_distance, cell, columns, rows, rng, attempts)
+        if len(points) >= count:
+            return rng.sample(points, count)
+        best = max(best, len(points))
+    raise PlacementError("Only %d points at least %s apart fit in a %sx%s area, %d were requested"
+                         % (best, min_distance, width, height, count))
+
+
+def sample_points(width, height, min_distance, cell, columns, rows, rng, attempts):
+    """
+    Fills the rectangle with points, see poisson_disk_sample().
+    """
+    # Point in each cell, row by row. Two empty cells of padding on every side spare the bounds checks.
+    stride = columns + 4
+    grid = [None] * (stride * (rows + 4))
+    # A point closer than min_distance can only be in the 5x5 cells around the candidate's cell, minus the corners.
+    neighbors = [r * stride + c for r in range(-2, 3) for c in range(-2, 3) if abs(r) + abs(c) < 4]
+    min_distance_sq = min_distance * min_distance
+    uniform = rng.uniform
+    cos = math.cos
+    sin = math.sin
+
+    point = (uniform(0, width), uniform(0, height))
+    grid[(int(point[1] / cell) + 2) * stride + int(point[0] / cell) + 2] = point
+    points = [point]
+    active = [point]
+    while active:
+        i = rng.randrange(len(active))
+        x, y = active[i]
+        for _ in range(attempts):
+            angle = uniform(0, 2 * math.pi)
+            distance = uniform(min_distance, 1.1 * min_distance)
+            px = x + distance * cos(angle)
+            py = y + distance * sin(angle)
+            if not (0 <= px < width and 0 <= py < height):
+                continue
+            index = (int(py / cell) + 2) * stride + int(px / cell) + 2
+            for offset in neighbors:
+                neighbor = grid[index + offset]
+                if neighbor is not None and (neighbor[0] - px) ** 2 + (neighbor[1] - py) ** 2 < min_distance_sq:
+                    break
+            else:
+                point = (px, py)
+                grid[index] = point
+                points.append(point)
+                active.append(point)
+                break
+        else:
+            # No room left around this point.
+            active[i] = active[-1]
+            active.pop()
+    return points
@@ -2,12 +2,48 @@ import pygame
 
 
 class Spritesheet:
-    def __init__(self, filename):
-        self.filename = filename
-        self.sprite_sheet = pygame.image.load(filename).convert()
+    """
+    A sprite sheet image that frames are cut out of with get_image(). Frames are memoized, so asking for the same
+    frame twice returns the same surface. Frames are shared and must not be drawn on.
+
+    Use Spritesheet.from_atlas() to get a sheet: every sheet is copied out of the texture atlas once per process and
+    shared by all its users.
+    """
+
+    # Process-wide registry of the sheets copied out of the atlas, by frame name.
+    sheets = {}
+
+    @classmethod
+    def from_atlas(cls, atlas, name):
+        """
+        Returns the sheet packed into the texture atlas under the given frame name.
+
+        :param atlas: projectSS.atlas.Atlas
+        :param name: Frame name of the sheet, its file name without extension.
+        :return: Spritesheet
+        """
+        sheet = cls.sheets.get(name)
+        if sheet is None:
+            # Copied out of the atlas without alpha, frames are cut out with a black color key.
+            sheet = cls(name, atlas[name].convert())
+            cls.sheets[name] = sheet
+        return sheet
+
+    def __init__(self, name, sprite_sheet):
+        """
+        :param name: Name of the sheet.
+        :param sprite_sheet: Surface of the sheet.
+        """
+        self.name = name
+        self.sprite_sheet = sprite_sheet
+        self.frames = {}  # Cut out frames by (x, y, w, h)
 
     def get_image(self, x, y, w, h):
-        sprite = pygame.Surface((w, h))
-        sprite.set_colorkey((0, 0, 0))
-        sprite.blit(self.sprite_sheet, (0, 0), (x, y, w, h))
+        key = (x, y, w, h)
+        sprite = self.frames.get(key)
+        if sprite is None:
+            sprite = pygame.Surface((w, h))
+            sprite.set_colorkey((0, 0, 0))
+            sprite.blit(self.sprite_sheet, (0, 0), (x, y, w, h))
+            self.frames[key] = sprite
         return sprite
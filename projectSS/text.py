@@ -0,0 +1,65 @@
+from collections import OrderedDict
+import pygame
+
+
+class TextRenderer:
+    """
+    Text rendering service used by Game.draw_text(). Keeps a single pygame Font object per font size and an LRU cache
+    of already rendered text surfaces, so static labels are only rasterized once.
+    """
+
+    def __init__(self, font_loc, max_size=256):
+        self.font_loc = font_loc
+        self.max_size = max_size  # Maximum number of rendered surfaces kept in the cache.
+
+        self.fonts = {}  # Font objects by size.
+        self.surfaces = OrderedDict()  # Rendered surfaces by (text, size, color), least recently used first.
+
+        # Cache statistics.
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, size):
+        """
+        Returns the Font object for the given size, creating it on first use.
+
+        :param size: The desired size of the text.
+        :return: pygame.font.Font
+        """
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(self.font_loc, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, text, size, color=(0, 0, 0), cache=True):
+        """
+        Returns a surface with the given text drawn on it.
+
+        :param text: String containing desired message to user.
+        :param size: The desired size of the text.
+        :param color: The RGB color of the text.
+        :param cache: False renders the text without storing it. Used for text that changes often, like the score.
+        :return: pygame.Surface
+        """
+        if not cache:
+            return self.font(size).render(text, True, color)
+
+        key = (text, size, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0